@@ -0,0 +1,64 @@
+"""
+Accessor calls per second with the cached unit conversion against the former astropy Quantity path.
+
+Usage: python benchmarks/bench_accessors.py
+
+Needs chimera installed, no database or network access is done.
+"""
+import datetime
+import time
+import timeit
+
+from astropy import units
+
+from chimera_ctioenviroment import conversion
+from chimera_ctioenviroment.instruments.ctioseeing import CTIOSeeing
+from chimera_ctioenviroment.instruments.ctioweather import CTIOWeather
+
+
+def weather():
+    ws = CTIOWeather()
+    ws._snapshot = ws._make_snapshot(datetime.datetime.utcnow(), 12.3, 45.6, 10.2, 270., 590.1)
+    # fresh snapshot, no refresh due for an hour.
+    ws._last_check = time.time()
+    ws._next_check = time.time() + 3600
+    return ws
+
+
+def seeing():
+    sm = CTIOSeeing()
+    sm._snapshot = sm._make_snapshot(datetime.datetime.utcnow(), 0.85, 1.2, 12345.)
+    # fresh snapshot, no refresh due for an hour.
+    sm._last_check = time.time()
+    sm._next_check = time.time() + 3600
+    return sm
+
+
+def calls(ws, sm):
+    return [('humidity', lambda: ws.humidity()),
+            ('temperature', lambda: ws.temperature(units.K)),
+            ('wind_speed', lambda: ws.wind_speed()),
+            ('pressure', lambda: ws.pressure()),
+            ('seeing', lambda: sm.seeing()),
+            ('getMetadata', lambda: ws.getMetadata(None))]
+
+
+def rate(function, n=2000):
+    return n / min(timeit.repeat(function, number=n, repeat=3))
+
+
+def main():
+    ws, sm = weather(), seeing()
+    fast = conversion.convert
+
+    for name, function in calls(ws, sm):
+        conversion.convert = conversion.astropy_convert
+        before = rate(function)
+        conversion.convert = fast
+        after = rate(function)
+        print '%-12s before %10.0f calls/s, after %10.0f calls/s, speedup %.1fx' % (name, before, after,
+                                                                                    after / before)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Size and scan time of a year of seeing on the columnar archive against the same readings on a ReadingStore
+SQLite table.
+
+Usage: python benchmarks/bench_archive.py [--interval SECONDS] [--directory DIRECTORY]
+
+No database, network access or chimera is needed.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+from chimera_ctioenviroment.archive import Archive
+
+
+def synthetic_year(interval):
+    '''
+    :return: (timestamps in microseconds, seeing) of one sample every interval seconds during 10 h nights.
+    '''
+    random = np.random.RandomState(0)
+    start = 1483228800 * 1000000  # 2017-01-01 00:00 UT
+    night = np.arange(0, 10 * 3600, interval, dtype=np.int64) * 1000000
+    t = np.concatenate([start + day * 86400 * 1000000 + night for day in range(365)])
+    seeing = random.lognormal(np.log(.9), .3, len(t)).astype(np.float32)
+    return t, seeing
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def timed(function, n=5):
+    best = None
+    for i in range(n):
+        t0 = time.time()
+        result = function()
+        elapsed = time.time() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--interval', type=int, default=30, help='seconds between seeing samples')
+    parser.add_argument('--directory', help='where to write the archive and the SQLite file. Defaults to a temp dir')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(dir=args.directory)
+    try:
+        t, seeing = synthetic_year(args.interval)
+        print '%d samples' % len(t)
+
+        archive = Archive(os.path.join(directory, 'archive'))
+        t0 = time.time()
+        nights = np.flatnonzero(np.diff(t) > 3600 * 1000000) + 1
+        for chunk_t, chunk_seeing in zip(np.split(t, nights), np.split(seeing, nights)):
+            archive.append('seeing', chunk_t, chunk_seeing)
+        append = time.time() - t0
+        size = directory_size(archive.root)
+        print 'archive: %.1f MB, %.1f bytes/sample, appended in %.2f s' % (size / 1e6, float(size) / len(t), append)
+
+        reader = Archive(archive.root, writable=False)
+        year, (qt, qv) = timed(lambda: reader.query('seeing'))
+        assert len(qt) == len(t)
+        week, (qt, qv) = timed(lambda: reader.query('seeing', t[len(t) / 2] / 1e6, t[len(t) / 2] / 1e6 + 7 * 86400))
+        good, (qt, qv) = timed(lambda: reader.query('seeing', high=.6))
+        print 'archive: year scan %.1f ms, one week %.2f ms, seeing <= 0.6" %.1f ms (%d samples)' % (
+            year * 1e3, week * 1e3, good * 1e3, len(qt))
+
+        path = os.path.join(directory, 'readings.sqlite')
+        db = sqlite3.connect(path)
+        db.execute("create table readings"
+                   " (t integer not null, quantity text not null, value real, created real not null)")
+        db.execute("create index readings_qt on readings (quantity, t)")
+        db.execute("create index readings_t on readings (t)")
+        created = time.time()
+        t0 = time.time()
+        db.executemany("insert into readings values (?, 'seeing', ?, ?)",
+                       ((int(ti), float(vi), created) for ti, vi in zip(t, seeing)))
+        db.commit()
+        append = time.time() - t0
+        size = os.path.getsize(path)
+        print 'sqlite:  %.1f MB, %.1f bytes/sample, appended in %.2f s' % (size / 1e6, float(size) / len(t), append)
+
+        def scan():
+            rows = db.execute("select t, value from readings where quantity = 'seeing' order by t").fetchall()
+            return np.array([r[0] for r in rows], dtype=np.int64), np.array([r[1] for r in rows], dtype=np.float32)
+
+        year, (qt, qv) = timed(scan, n=2)
+        print 'sqlite:  year scan %.1f ms' % (year * 1e3)
+        db.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
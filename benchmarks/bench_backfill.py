@@ -0,0 +1,36 @@
+"""
+Rows per second of the CTIO database backfill, against a local SQLite stand-in.
+
+Usage: python benchmarks/bench_backfill.py [rows]
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+import sqlalchemy
+
+from chimera_ctioenviroment import ctiodb
+
+import standins
+
+
+def main(rows):
+    fd, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    try:
+        since = standins.make_ctio_database(path, rows) - datetime.timedelta(seconds=1)
+        engine = sqlalchemy.create_engine('sqlite:///' + path)
+        for name, fetch in (('weather', ctiodb.fetch_weather), ('DIMM2_SEEING', ctiodb.fetch_seeing)):
+            t0 = time.time()
+            t, columns = fetch(engine, since)
+            elapsed = time.time() - t0
+            assert len(t) == rows
+            print '%-12s %d rows in %.3f s: %.0f rows/s' % (name, rows, elapsed, rows / elapsed)
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,103 @@
+"""
+Cold import time of the plugin modules, in the style of python -X importtime (which Python 2 lacks).
+
+Every module is imported on a fresh interpreter after what chimera itself loads (astropy.units and the chimera
+instrument interfaces), so only the cost of the plugin is counted. The dependencies loaded by the import are listed,
+and --tree prints the imports which took longer than --threshold. Exits with status 1 if a module is over budget.
+
+Usage: python benchmarks/bench_import.py [--budget MS] [--tree] [module ...]
+
+No database or network access is needed.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+MODULES = ['chimera_ctioenviroment.instruments.ctioweather', 'chimera_ctioenviroment.instruments.ctioseeing',
+           'chimera_ctioenviroment.instruments.lcogtweather', 'chimera_ctioenviroment.instruments.rasicam',
+           'chimera_ctioenviroment.instruments.siteweather']
+
+# loaded by chimera before any plugin.
+BASELINE = ['astropy.units', 'chimera.interfaces.weatherstation', 'chimera.interfaces.seeingmonitor',
+            'chimera.instruments.weatherstation', 'chimera.instruments.seeingmonitor']
+
+# dependencies which should only be loaded by the instruments using them, on __start__.
+DEPENDENCIES = ['sqlalchemy', 'requests', 'xmltodict', 'astropy.units.cds']
+
+CHILD = r'''
+import __builtin__, json, sys, time
+for name in %(baseline)r:
+    __import__(name)
+rows = []
+if %(trace)r:
+    original = __builtin__.__import__
+    stack = []
+
+    def traced(name, globals=None, locals=None, fromlist=None, level=-1):
+        loaded = len(sys.modules)
+        stack.append(0.)
+        t0 = time.time()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.time() - t0
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            if len(sys.modules) > loaded:
+                rows.append((len(stack), (elapsed - children) * 1e6, elapsed * 1e6, name))
+
+    __builtin__.__import__ = traced
+t0 = time.time()
+__import__(%(module)r)
+elapsed = time.time() - t0
+print json.dumps(dict(seconds=elapsed, rows=rows, loaded=[d for d in %(dependencies)r if d in sys.modules]))
+'''
+
+
+def run(module, trace=False):
+    code = CHILD % dict(baseline=BASELINE, trace=trace, module=module, dependencies=DEPENDENCIES)
+    output = subprocess.check_output([sys.executable, '-c', code], env=os.environ)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def print_tree(rows, threshold):
+    print 'import time: self [us] | cumulative | imported package'
+    # rows are appended when each import returns, children before their parent.
+    for depth, self_us, cumulative_us, name in reversed(rows):
+        if cumulative_us >= threshold * 1e3:
+            print 'import time: %9d | %10d | %s%s' % (self_us, cumulative_us, '  ' * depth, name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('modules', nargs='*', default=MODULES, help='modules to import')
+    parser.add_argument('--budget', type=float, default=50., help='maximum median import time, in ms')
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per module')
+    parser.add_argument('--tree', action='store_true', help='print the slowest imports of each module')
+    parser.add_argument('--threshold', type=float, default=5., help='slowest imports printed by --tree, in ms')
+    args = parser.parse_args()
+
+    over = []
+    for module in args.modules:
+        times = [run(module)['seconds'] * 1e3 for i in range(args.repeat)]
+        result = run(module, trace=args.tree)
+        median = np.median(times)
+        print '%-50s median %6.1f ms  min %6.1f ms  loads %s' % (module, median, min(times),
+                                                                 ', '.join(result['loaded']) or 'no dependency')
+        if args.tree:
+            print_tree(result['rows'], args.threshold)
+        if median > args.budget:
+            over.append(module)
+
+    if over:
+        print 'Over the %.0f ms budget: %s' % (args.budget, ', '.join(over))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Runs the real instrument classes against local stand-ins of the CTIO database, the LCOGT weather API and RASICAM.
+
+Reports getMetadata latency percentiles, refresh throughput and CPU time per poll of each instrument.
+
+Usage: python benchmarks/bench_offline.py [--polls N] [--latency S] [--failure-rate F] [--recordings DIR]
+
+Needs chimera installed. Nothing is fetched from the network.
+"""
+import argparse
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from chimera_ctioenviroment.instruments.ctioseeing import CTIOSeeing
+from chimera_ctioenviroment.instruments.ctioweather import CTIOWeather
+from chimera_ctioenviroment.instruments.lcogtweather import LCOGTWeather
+from chimera_ctioenviroment.instruments.rasicam import Rasicam
+
+import standins
+
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure(name, refresh, metadata, polls, between=None):
+    t0, c0 = time.time(), cpu_time()
+    for i in range(polls):
+        refresh()
+    wall, cpu = time.time() - t0, cpu_time() - c0
+
+    if between is not None:
+        between()
+
+    latencies = []
+    for i in range(polls * 10):
+        t = time.time()
+        metadata(None)
+        latencies.append(time.time() - t)
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e3
+
+    print '%-13s %8.1f refresh/s %8.3f ms CPU/poll   getMetadata p50 %.3f ms p90 %.3f ms p99 %.3f ms' % (
+        name, polls / wall, cpu / polls * 1e3, p50, p90, p99)
+
+
+def ctio(tmp, rows, polls):
+    uri = 'sqlite:///' + os.path.join(tmp, 'ctio.sqlite')
+    standins.make_ctio_database(uri[len('sqlite:///'):], rows)
+    for cls in (CTIOWeather, CTIOSeeing):
+        instrument = cls()
+        instrument['uri'] = uri
+        instrument['cache_path'] = ''
+        instrument['check_interval'] = 0
+        instrument['adaptive_schedule'] = False
+        instrument['stale_while_revalidate'] = False
+        instrument.__start__()
+        instrument._refresh()
+        # every refresh goes to the database, getMetadata is then served from the snapshot.
+        measure(cls.__name__, instrument._refresh, instrument.getMetadata, polls,
+                lambda: setattr(instrument, '_next_check', time.time() + 3600))
+
+
+def lcogt(url, polls, sites):
+    instrument = LCOGTWeather()
+    instrument['url'] = url + '/query?site=lsc&datumname='
+    instrument['sites'] = sites
+    instrument['cache_path'] = ''
+    instrument.__start__()
+    # polls are driven by the benchmark, not by the shared poller.
+    instrument._job.cancel()
+    try:
+        sites = instrument._scrapper.sites
+        measure('LCOGTWeather' if len(sites) == 1 else 'LCOGT %d sites' % len(sites), instrument._poll,
+                instrument.getMetadata, polls)
+    finally:
+        instrument.__stop__()
+
+
+def rasicam(url, polls):
+    instrument = Rasicam()
+    instrument['url'] = url + '/RASICAMWebService/vi/'
+    instrument['cache_path'] = ''
+    instrument.__start__()
+    # polls are driven by the benchmark, not by the shared poller.
+    instrument._job.cancel()
+    try:
+        measure('Rasicam', instrument._poll, instrument.getMetadata, polls)
+        print '%-13s %s' % ('', instrument.poll_stats())
+    finally:
+        instrument.__stop__()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--polls', type=int, default=200, help='refreshes per instrument')
+    parser.add_argument('--rows', type=int, default=50000, help='rows of the CTIO database stand-in')
+    parser.add_argument('--latency', type=float, default=0., help='mean HTTP latency, in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0., help='fraction of failed HTTP requests')
+    parser.add_argument('--recordings', help='directory with recorded LCOGT and RASICAM payloads')
+    parser.add_argument('--lcogt-sites', default='lsc', help='comma separated LCOGT sites scraped in one batch')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    process, url = standins.start_server(recordings=standins.Recordings(args.recordings), latency=args.latency,
+                                         failure_rate=args.failure_rate)
+    try:
+        ctio(tmp, args.rows, args.polls)
+        lcogt(url, args.polls, args.lcogt_sites.split(','))
+        rasicam(url, args.polls)
+    finally:
+        process.terminate()
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Compares the streaming RASICAM extractor against the former xmltodict path.
+
+Usage: python benchmarks/bench_rasicam_xml.py [recorded_payload.xml ...]
+
+Without arguments a large synthetic ChartData document is used.
+"""
+import sys
+import timeit
+
+import xmltodict
+
+from chimera_ctioenviroment import rasicamxml
+
+
+def synthetic_payload(points=20000):
+    series = ''.join(['<Point><Time>%d</Time><Value>%.3f</Value></Point>' % (i, i * 0.001) for i in range(points)])
+    return ('<?xml version="1.0" encoding="utf-8"?>'
+            '<ChartData><ResponseType>Chart</ResponseType>'
+            '<StDev><GlobalStDev>0.012</GlobalStDev><StDevThresh>0.05</StDevThresh></StDev>'
+            '<Series>%s</Series></ChartData>' % series)
+
+
+def xmltodict_path(body):
+    aux_dict = xmltodict.parse(body)['ChartData']
+    str(aux_dict)  # the former _watch dumped the whole dict on every poll
+    return aux_dict['ResponseType'], aux_dict['StDev']['GlobalStDev'], aux_dict['StDev']['StDevThresh']
+
+
+def streaming_path(body):
+    data = rasicamxml.extract(body)
+    return data['ResponseType'], data['GlobalStDev'], data['StDevThresh']
+
+
+def main(paths):
+    payloads = [(path, open(path, 'rb').read()) for path in paths] or [('synthetic', synthetic_payload())]
+
+    for name, body in payloads:
+        assert xmltodict_path(body) == streaming_path(body)
+        n = 20
+        old = min(timeit.repeat(lambda: xmltodict_path(body), number=n, repeat=3)) / n
+        new = min(timeit.repeat(lambda: streaming_path(body), number=n, repeat=3)) / n
+        print '%s (%d bytes): xmltodict %.3f ms, streaming %.3f ms, speedup %.1fx' % (name, len(body), old * 1e3,
+                                                                                   new * 1e3, old / new)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
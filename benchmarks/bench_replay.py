@@ -0,0 +1,84 @@
+"""
+Replays a recorded log, or a synthetic night, into CTIOWeather, CTIOSeeing, LCOGTWeather and Rasicam.
+
+Every record is fed to the replay method of its instrument, followed by a call of the accessor and of getMetadata.
+Reports records per second, the latency of replay and getMetadata and the peak memory of the process.
+
+Usage: python benchmarks/bench_replay.py [--log LOG] [--hours H] [--speed N]
+
+Logs are recorded by the instruments with the record_path option. Needs chimera installed, no database or network
+access is done.
+"""
+import argparse
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from chimera_ctioenviroment.instruments.ctioseeing import CTIOSeeing
+from chimera_ctioenviroment.instruments.ctioweather import CTIOWeather
+from chimera_ctioenviroment.instruments.lcogtweather import LCOGTWeather
+from chimera_ctioenviroment.instruments.rasicam import Rasicam
+from chimera_ctioenviroment.replay import Replayer
+
+import standins
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--log', help='log recorded with the record_path option. Defaults to a synthetic night')
+    parser.add_argument('--hours', type=float, default=12., help='length of the synthetic night')
+    parser.add_argument('--speed', type=float, default=0., help='replay speed, 0 for as fast as possible')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        path = args.log
+        if path is None:
+            path = os.path.join(directory, 'night.log.gz')
+            t0 = time.time()
+            records = standins.make_night_log(path, args.hours)
+            print 'Synthetic %.1f h night: %d records, %.1f MB, written in %.1f s' % (
+                args.hours, records, os.path.getsize(path) / 1e6, time.time() - t0)
+
+        instruments = dict()
+        accessors = dict()
+        for cls, accessor in ((CTIOWeather, 'temperature'), (CTIOSeeing, 'seeing'),
+                              (LCOGTWeather, 'temperature'), (Rasicam, 'sky_transparency')):
+            instrument = cls()
+            instrument['replay'] = True
+            instrument['cache_path'] = ''
+            instrument.__start__()
+            instruments[cls.__name__] = instrument
+            accessors[cls.__name__] = getattr(instrument, accessor)
+
+        latencies = dict([(name, []) for name in instruments])
+
+        def between(t, source):
+            t0 = time.time()
+            accessors[source]()
+            instruments[source].getMetadata(None)
+            latencies[source].append(time.time() - t0)
+
+        t0 = time.time()
+        replayed = Replayer(path, args.speed).run(instruments, between)
+        wall = time.time() - t0
+
+        print 'Replayed %d records in %.2f s: %.0f records/s, peak RSS %.0f MB' % (
+            replayed, wall, replayed / wall, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.)
+        for name in sorted(latencies):
+            if latencies[name]:
+                p50, p99 = np.percentile(latencies[name], (50, 99)) * 1e3
+                print '%-13s %6d records, accessor + getMetadata p50 %.3f ms p99 %.3f ms' % (
+                    name, len(latencies[name]), p50, p99)
+        for instrument in instruments.values():
+            instrument.__stop__()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Cost of the rolling statistics per sample and per query against recomputing them with numpy over the window.
+
+Usage: python benchmarks/bench_rolling.py
+
+No database, network access or chimera is needed.
+"""
+import random
+import time
+
+import numpy as np
+
+from chimera_ctioenviroment.rolling import RollingWindow
+
+
+def main():
+    random.seed(0)
+    for samples in (60, 360, 3600, 36000):
+        # one sample every 10 s.
+        window = RollingWindow(samples * 10, expected_size=samples)
+        values = [random.gauss(1., .3) for i in range(2 * samples)]
+
+        t0 = time.time()
+        for i, value in enumerate(values):
+            window.append((i + 1) * 10000000, value)
+        append = (time.time() - t0) / len(values)
+
+        n = 10000
+        t0 = time.time()
+        for i in range(n):
+            window.stats['median']
+        query = (time.time() - t0) / n
+
+        recent = np.array(values[-samples:])
+        n = 100
+        t0 = time.time()
+        for i in range(n):
+            np.percentile(recent, (10, 50, 90)), recent.mean(), recent.std(), recent.max()
+        numpy = (time.time() - t0) / n
+
+        print '%6d samples: append %6.1f us, query %5.2f us, numpy recompute %8.1f us' % (samples, append * 1e6,
+                                                                                        query * 1e6, numpy * 1e6)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Local stand-ins for the CTIO database, the LCOGT weather API and the RASICAM web service.
+"""
+import datetime
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import time
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import numpy as np
+
+LCOGT_DATUMS = {'Weather Humidity Value': (10, 90),
+                'Weather Air Temperature Value': (-5, 25),
+                'Weather Wind Speed Value': (0, 20),
+                'Weather Wind Direction Value': (0, 360),
+                'Weather Dew Point Value': (-20, 10),
+                'Weather Barometric Pressure Value': (580, 600),
+                'Boltwood Transparency Measure': (0, 100)}
+
+RASICAM_XML = ('<?xml version="1.0" encoding="utf-8"?>'
+               '<ChartData><ResponseType>Chart</ResponseType>'
+               '<StDev><GlobalStDev>%.4f</GlobalStDev><StDevThresh>0.05</StDevThresh></StDev>'
+               '<Series>%s</Series></ChartData>')
+
+
+def make_ctio_database(path, rows, start=None, step=10):
+    '''
+    Creates a SQLite database with the weather and DIMM2_SEEING tables of the CTIO database.
+    :param rows: rows per table.
+    :param start: UT datetime of the first row. Defaults to rows * step seconds ago.
+    :param step: seconds between rows.
+    :return: start.
+    '''
+    if start is None:
+        start = datetime.datetime.utcnow() - datetime.timedelta(seconds=rows * step)
+    db = sqlite3.connect(path)
+    db.execute("create table weather (time datetime, temp float, hum float, pres float, wdir float, wspeed float)")
+    db.execute("create table DIMM2_SEEING (ut datetime, seeing float, airmass float, flux_s1 float, flux_s2 float)")
+    db.execute("create index weather_time on weather (time)")
+    db.execute("create index dimm2_ut on DIMM2_SEEING (ut)")
+    times = [str(start + datetime.timedelta(seconds=step * i)) for i in range(rows)]
+    values = np.random.uniform(0.5, 100, (rows, 5)).tolist()
+    db.executemany("insert into weather values (?, ?, ?, ?, ?, ?)", [[t] + v for t, v in zip(times, values)])
+    db.executemany("insert into DIMM2_SEEING values (?, ?, ?, ?, ?)", [[t] + v[:4] for t, v in zip(times, values)])
+    db.commit()
+    db.close()
+    return start
+
+
+class Recordings(object):
+    """
+    LCOGT JSON and RASICAM XML payloads, either recorded ones or synthetic.
+
+    A recordings directory holds lcogt/<datum name>.json files with the API answers and rasicam/*.xml files.
+    """
+
+    def __init__(self, path=None, history=1440, period=60., points=2000):
+        self.period = period
+        self.lcogt = dict()
+        self.rasicam = []
+        if path is not None:
+            for name in glob.glob(os.path.join(path, 'lcogt', '*.json')):
+                self.lcogt[os.path.basename(name)[:-5]] = json.load(open(name))
+            self.rasicam = [open(name, 'rb').read() for name in sorted(glob.glob(os.path.join(path, 'rasicam',
+                                                                                              '*.xml')))]
+        if not self.lcogt:
+            now = time.time()
+            for datum, (low, high) in LCOGT_DATUMS.items():
+                rows = []
+                for i in range(history, 0, -1):
+                    ts = time.strftime('%Y/%m/%d %H:%M:%S', time.gmtime(now - i * period))
+                    value = random.uniform(low, high)
+                    rows.append({'TimeStamp': ts, 'TimeStampMeasured': ts, 'Value': value,
+                                 'ValueString': '%.2f' % value})
+                self.lcogt[datum] = rows
+        if not self.rasicam:
+            series = ''.join(['<Point><Time>%d</Time><Value>%.3f</Value></Point>' % (i, random.random())
+                              for i in range(points)])
+            self.rasicam = [RASICAM_XML % (random.uniform(0, 0.1), series) for i in range(10)]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(random.uniform(0, 2 * server.latency))
+        if random.random() < server.failure_rate:
+            if random.random() < 0.5:
+                self.send_error(500)
+            else:
+                # drop the connection without an answer
+                self.close_connection = 1
+            return
+
+        url = urlparse.urlparse(self.path)
+        if url.path.startswith('/query'):
+            self.lcogt(urlparse.parse_qs(url.query))
+        elif url.path.startswith('/RASICAMWebService'):
+            self.rasicam()
+        else:
+            self.send_error(404)
+
+    def answer(self, body, content_type, headers=()):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def lcogt(self, query):
+        rows = self.server.recordings.lcogt.get(query.get('datumname', [''])[0], [])
+        if 'start' in query:
+            rows = [row for row in rows if row['TimeStamp'] > query['start'][0]]
+        self.answer(json.dumps(rows), 'application/json')
+
+    def rasicam(self):
+        server = self.server
+        payloads = server.recordings.rasicam
+        server.requests += 1
+        body = payloads[(server.requests // server.change_every) % len(payloads)]
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.answer(body, 'text/xml', [('ETag', etag)])
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server answering like weather-api.lco.global/query and rasicam.ctio.noao.edu/RASICAMWebService/vi/.
+    """
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), recordings=None, latency=0., failure_rate=0., change_every=1):
+        '''
+        :param latency: mean answer latency, in seconds.
+        :param failure_rate: fraction of requests answered with an error or a dropped connection.
+        :param change_every: RASICAM payload changes every change_every requests.
+        '''
+        HTTPServer.__init__(self, address, StandInHandler)
+        self.recordings = recordings or Recordings()
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.change_every = change_every
+        self.requests = 0
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+
+def _serve(queue, kwargs):
+    server = StandInServer(**kwargs)
+    queue.put(server.url)
+    server.serve_forever()
+
+
+def start_server(**kwargs):
+    '''
+    Runs a StandInServer on a separate process, so it does not count on the CPU time of the benchmark.
+    :return: (process, base url).
+    '''
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(queue, kwargs))
+    process.daemon = True
+    process.start()
+    return process, queue.get(timeout=30)
+
+
+def make_night_log(path, hours=12., start=None, points=200):
+    '''
+    Writes a replay log of a synthetic night: CTIO weather and seeing rows every 30 seconds, LCOGT scrapes every
+    minute and RASICAM payloads every 30 seconds.
+    :param start: time.time() of the first record. Defaults to hours ago.
+    :param points: points of the RASICAM chart series.
+    :return: number of records.
+    '''
+    from chimera_ctioenviroment.replay import Recorder
+
+    start = time.time() - hours * 3600 if start is None else start
+    recorder = Recorder(path)
+    series = ''.join(['<Point><Time>%d</Time><Value>%.3f</Value></Point>' % (i, random.random())
+                      for i in range(points)])
+    records = 0
+    for i in range(int(hours * 3600 / 30)):
+        t = start + i * 30
+        ut = datetime.datetime.utcfromtimestamp(t)
+        recorder.record('CTIOWeather', (ut, random.uniform(5, 20), random.uniform(10, 90), random.uniform(0, 40),
+                                        random.uniform(0, 360), random.uniform(580, 600)), t)
+        recorder.record('CTIOSeeing', (ut, random.uniform(0.5, 2.), random.uniform(1., 2.),
+                                       random.uniform(1000, 50000)), t)
+        recorder.record('Rasicam', RASICAM_XML % (random.uniform(0, 0.1), series), t)
+        records += 3
+        if i % 2 == 0:
+            ts = ut.strftime('%Y/%m/%d %H:%M:%S')
+            scrape = dict()
+            for key, datum in (('humidity', 'Weather Humidity Value'),
+                               ('temperature', 'Weather Air Temperature Value'),
+                               ('wind_speed', 'Weather Wind Speed Value'),
+                               ('wind_direction', 'Weather Wind Direction Value'),
+                               ('dew_point', 'Weather Dew Point Value'),
+                               ('pressure', 'Weather Barometric Pressure Value'),
+                               ('sky_transparency', 'Boltwood Transparency Measure')):
+                value = random.uniform(*LCOGT_DATUMS[datum])
+                scrape[key] = {u'TimeStamp': ts, u'TimeStampMeasured': ts, u'Value': value,
+                               u'ValueString': u'%.2f' % value}
+            recorder.record('LCOGTWeather', scrape, t)
+            records += 1
+    recorder.close()
+    return records
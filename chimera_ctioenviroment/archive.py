@@ -0,0 +1,265 @@
+import datetime
+import os
+import threading
+import time
+
+import numpy as np
+
+from chimera_ctioenviroment.history import to_timestamp
+
+DAY = 86400 * 1000000
+
+# one entry per chunk: night (YYYYMMDD), first and last timestamps, position on the columns, number of samples,
+# minimum and maximum values.
+INDEX_DTYPE = np.dtype([('night', '<i4'), ('first', '<i8'), ('last', '<i8'), ('offset', '<i8'), ('count', '<i8'),
+                        ('min', '<f4'), ('max', '<f4')])
+
+_MAX_DELTA = np.iinfo(np.int32).max
+
+
+class _Column(object):
+    """
+    Files of one quantity: <quantity>.idx chunk index, <quantity>.dt int32 timestamp deltas and <quantity>.f32
+    values.
+    """
+
+    def __init__(self, root, quantity, writable):
+        self.paths = dict([(ext, os.path.join(root, '%s.%s' % (quantity, ext))) for ext in ('idx', 'dt', 'f32')])
+        self._stat = None
+        self._maps = None
+        self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        self.count = 0
+        self.reload()
+        if not writable:
+            return
+        # columns written after the index (e.g. by a crash between both) are dropped.
+        for ext, dtype in (('dt', np.int32), ('f32', np.float32)):
+            size = self.count * np.dtype(dtype).itemsize
+            if os.path.exists(self.paths[ext]) and os.path.getsize(self.paths[ext]) > size:
+                with open(self.paths[ext], 'r+b') as f:
+                    f.truncate(size)
+
+    def reload(self):
+        '''
+        Reads the index again if another process replaced it.
+        '''
+        try:
+            stat = os.stat(self.paths['idx'])
+        except OSError:
+            return
+        stat = (stat.st_ino, stat.st_mtime, stat.st_size)
+        if stat != self._stat:
+            self.index = np.fromfile(self.paths['idx'], dtype=INDEX_DTYPE)
+            self.count = int(self.index['count'].sum())
+            self._stat = stat
+
+    def maps(self):
+        '''
+        :return: (deltas, values) memory maps of the columns.
+        '''
+        maps = self._maps
+        if maps is None or len(maps[0]) < self.count:
+            if self.count:
+                maps = (np.memmap(self.paths['dt'], dtype=np.int32, mode='r', shape=(self.count,)),
+                        np.memmap(self.paths['f32'], dtype=np.float32, mode='r', shape=(self.count,)))
+            else:
+                maps = (np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32))
+            self._maps = maps
+        return maps
+
+
+class Archive(object):
+    """
+    Long term columnar archive of the readings of one instrument, one directory per instrument.
+
+    Each quantity is stored on chunks of one night: timestamps as int32 microsecond deltas from the previous
+    sample and values as float32, with the minimum and maximum value of every chunk on a small index. Queries only
+    read, through memory maps, the chunks which may hold samples on the requested time and value ranges.
+
+    Nights start at night_offset hours UT, so a Chilean night is never split. One process writes an archive, any
+    number of processes may read it.
+    """
+
+    def __init__(self, root, night_offset=12, writable=True):
+        '''
+        :param root: directory of the archive.
+        :param night_offset: UT hour when nights start.
+        :param writable: False to only query an archive written by another process.
+        '''
+        root = os.path.expanduser(root)
+        if writable and not os.path.isdir(root):
+            os.makedirs(root)
+        self.root = root
+        self.writable = writable
+        self.night_offset = night_offset * 3600 * 1000000
+        self._columns = dict()
+        self._lock = threading.Lock()
+        self._updated = 0
+
+    def quantities(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted([name[:-4] for name in os.listdir(self.root) if name.endswith('.idx')])
+
+    def _column(self, quantity):
+        column = self._columns.get(quantity)
+        if column is None:
+            column = self._columns[quantity] = _Column(self.root, quantity, self.writable)
+        elif not self.writable:
+            column.reload()
+        return column
+
+    def _night(self, day):
+        date = datetime.date(1970, 1, 1) + datetime.timedelta(days=int(day))
+        return date.year * 10000 + date.month * 100 + date.day
+
+    def append(self, quantity, t, values):
+        '''
+        Appends the samples newer than the last archived one. NaNs are skipped.
+        :param t: sorted int64 array, microseconds since the epoch.
+        :param values: array of values.
+        :return: number of samples archived.
+        '''
+        t = np.asarray(t, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float32)
+        with self._lock:
+            column = self._column(quantity)
+            index = column.index
+            valid = ~np.isnan(values)
+            if len(index):
+                valid &= t > index['last'][-1]
+            t, values = t[valid], values[valid]
+            n = len(t)
+            if not n:
+                return 0
+
+            days = (t - self.night_offset) // DAY
+            previous_t = np.empty(n, dtype=np.int64)
+            previous_t[1:] = t[:-1]
+            previous_day = np.empty(n, dtype=np.int64)
+            previous_day[1:] = days[:-1]
+            if len(index):
+                previous_t[0] = index['last'][-1]
+                previous_day[0] = (previous_t[0] - self.night_offset) // DAY
+            deltas = t - previous_t
+            # a new chunk starts on every night and after gaps too long for an int32 delta.
+            new = (days != previous_day) | (deltas > _MAX_DELTA)
+            if not len(index):
+                new[0] = True
+            deltas[new] = 0
+
+            chunks = [index]
+            starts = list(np.flatnonzero(new)) + [n]
+            if starts[0] > 0:
+                # the first samples extend the last chunk.
+                last = index[-1:].copy()
+                head = values[:starts[0]]
+                last['last'] = t[starts[0] - 1]
+                last['count'] += starts[0]
+                last['min'] = min(last['min'][0], head.min())
+                last['max'] = max(last['max'][0], head.max())
+                chunks = [index[:-1], last]
+            offset = column.count + starts[0]
+            for start, end in zip(starts[:-1], starts[1:]):
+                chunk = np.zeros(1, dtype=INDEX_DTYPE)
+                chunk['night'] = self._night(days[start])
+                chunk['first'] = t[start]
+                chunk['last'] = t[end - 1]
+                chunk['offset'] = offset
+                chunk['count'] = end - start
+                chunk['min'] = values[start:end].min()
+                chunk['max'] = values[start:end].max()
+                chunks.append(chunk)
+                offset += end - start
+            index = np.concatenate(chunks)
+
+            with open(column.paths['dt'], 'ab') as f:
+                deltas.astype(np.int32).tofile(f)
+            with open(column.paths['f32'], 'ab') as f:
+                values.tofile(f)
+            tmp = column.paths['idx'] + '.tmp'
+            index.tofile(tmp)
+            os.rename(tmp, column.paths['idx'])
+            column.index = index
+            column.count += n
+            column.reload()
+            return n
+
+    def update(self, history, interval=0.):
+        '''
+        Archives the samples of history newer than the archived ones, at most once every interval seconds.
+        :param history: history.History.
+        :return: number of samples archived.
+        '''
+        if time.time() < self._updated + interval:
+            return 0
+        self._updated = time.time()
+        archived = 0
+        for quantity in history.quantities():
+            last = self.last_timestamp(quantity)
+            t, v = history.query(quantity, since=None if last is None else (last + 1) / 1e6)
+            archived += self.append(quantity, t, v)
+        return archived
+
+    def last_timestamp(self, quantity):
+        '''
+        :return: timestamp of the latest archived sample of quantity, in microseconds since the epoch, or None.
+        '''
+        with self._lock:
+            index = self._column(quantity).index
+            return int(index['last'][-1]) if len(index) else None
+
+    def chunks(self, quantity):
+        '''
+        :return: the index of quantity, a numpy structured array of INDEX_DTYPE with one entry per chunk.
+        '''
+        with self._lock:
+            return self._column(quantity).index.copy()
+
+    def query(self, quantity, since=None, until=None, low=None, high=None):
+        '''
+        :param since: lower bound, see history.to_timestamp.
+        :param until: upper bound, see history.to_timestamp.
+        :param low: only values not below low are returned.
+        :param high: only values not above high are returned.
+        :return: (timestamps in microseconds since the epoch, float32 values) numpy arrays, oldest first.
+        '''
+        since = None if since is None else to_timestamp(since)
+        until = None if until is None else to_timestamp(until)
+        with self._lock:
+            column = self._column(quantity)
+            index = column.index
+            deltas, values = column.maps()
+
+        selected = np.ones(len(index), dtype=bool)
+        if since is not None:
+            selected &= index['last'] >= since
+        if until is not None:
+            selected &= index['first'] <= until
+        if low is not None:
+            selected &= index['max'] >= low
+        if high is not None:
+            selected &= index['min'] <= high
+
+        ts = []
+        vs = []
+        for chunk in index[selected]:
+            start, end = chunk['offset'], chunk['offset'] + chunk['count']
+            t = np.cumsum(deltas[start:end], dtype=np.int64)
+            t += chunk['first']
+            v = values[start:end]
+            lo = 0 if since is None else np.searchsorted(t, since, 'left')
+            hi = len(t) if until is None else np.searchsorted(t, until, 'right')
+            t, v = t[lo:hi], v[lo:hi]
+            if low is not None or high is not None:
+                keep = np.ones(len(v), dtype=bool)
+                if low is not None:
+                    keep &= v >= low
+                if high is not None:
+                    keep &= v <= high
+                t, v = t[keep], v[keep]
+            ts.append(t)
+            vs.append(v)
+        if not ts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return np.concatenate(ts), np.concatenate(vs)
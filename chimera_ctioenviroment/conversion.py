@@ -0,0 +1,69 @@
+from astropy import units
+from astropy.units import imperial
+
+# composing units is expensive, build them once for every instrument.
+M_S = units.m / units.s
+MPH = imperial.mile / units.hour
+# the same unit as astropy.units.cds.mmHg (and equal to it), without importing cds, which costs ~100 ms.
+MMHG = units.def_unit('mmHg', 133.322387415 * units.Pa)
+
+EQUIVALENCIES = {None: [],
+                 'temperature': units.temperature()}
+
+# (unit_in, unit_out, equivalency) -> function
+_cache = {}
+
+
+def astropy_convert(value, unit_in, unit_out, equivalency='temperature'):
+    '''
+    Reference conversion through astropy Quantities.
+    '''
+    if unit_in == unit_out:
+        return value
+    return (value * unit_in).to(unit_out, EQUIVALENCIES[equivalency]).value
+
+
+def _identity(value):
+    return value
+
+
+def converter(unit_in, unit_out, equivalency='temperature'):
+    '''
+    Returns a function converting plain floats from unit_in to unit_out.
+
+    Conversions between the units used by the instruments are affine, so the astropy machinery is only run once
+    per pair of units to find their scale and offset.
+    '''
+    key = (unit_in, unit_out, equivalency)
+    try:
+        return _cache[key]
+    except KeyError:
+        pass
+
+    if unit_in == unit_out:
+        function = _identity
+    else:
+        offset = astropy_convert(0., unit_in, unit_out, equivalency)
+        scale = astropy_convert(1., unit_in, unit_out, equivalency) - offset
+        if abs(astropy_convert(100., unit_in, unit_out, equivalency) - (100. * scale + offset)) > 1e-9 * abs(
+                100. * scale + offset):
+            function = lambda value: astropy_convert(value, unit_in, unit_out, equivalency)
+        elif offset == 0.:
+            function = lambda value: value * scale
+        else:
+            function = lambda value: value * scale + offset
+
+    _cache[key] = function
+    return function
+
+
+def convert(value, unit_in, unit_out, equivalency='temperature'):
+    '''
+    Converts value from unit_in to unit_out using the cached converter.
+    '''
+    if value is None:
+        return None
+    if unit_in is unit_out:
+        # hashing astropy units for the cache lookup costs more than the default unit conversions.
+        return value
+    return converter(unit_in, unit_out, equivalency)(value)
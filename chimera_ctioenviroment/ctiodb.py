@@ -0,0 +1,195 @@
+import collections
+import datetime
+import logging
+import threading
+import time
+
+import numpy as np
+
+from chimera_ctioenviroment.metrics import Metrics
+
+log = logging.getLogger("chimera." + __name__)
+
+# Latest weather and DIMM2 rows in a single round trip. Both sides are left joined
+# against a dummy row so an empty table does not hide the other one.
+SNAPSHOT_QUERY = ("select w.time, w.temp, w.hum, w.pres, w.wdir, w.wspeed,"
+                  "       s.ut, s.seeing, s.airmass, s.flux_s1, s.flux_s2"
+                  "  from (select 1 as one) d"
+                  "  left join (select time, temp, hum, pres, wdir, wspeed"
+                  "               from weather"
+                  "              order by time desc"
+                  "              limit 1) w on 1 = 1"
+                  "  left join (select ut, seeing, airmass, flux_s1, flux_s2"
+                  "               from DIMM2_SEEING"
+                  "              order by ut desc"
+                  "              limit 1) s on 1 = 1")
+
+# weather: (time, temp, hum, wspeed, wdir, pres) or None
+# seeing: (ut, seeing, airmass, flux) or None
+DBSnapshot = collections.namedtuple('DBSnapshot', ['weather', 'seeing', 'fetched_at'])
+
+WEATHER_COLUMNS = ('temp', 'hum', 'wspeed', 'wdir', 'pres')
+SEEING_COLUMNS = ('seeing', 'airmass', 'flux_s1', 'flux_s2')
+
+
+
+def _as_datetime(value):
+    # drivers without datetime support (e.g. sqlite) return strings.
+    if isinstance(value, basestring):
+        return datetime.datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f' if '.' in value else '%Y-%m-%d %H:%M:%S')
+    return value
+
+
+_engines = {}
+_caches = {}
+_registry_lock = threading.Lock()
+
+
+def get_engine(uri):
+    '''
+    Returns the process wide engine (and connection pool) for uri.
+    '''
+    # the driver is loaded by the first CTIO instrument started, not when the plugin is imported.
+    import sqlalchemy
+    with _registry_lock:
+        if uri not in _engines:
+            _engines[uri] = sqlalchemy.create_engine(uri, pool_recycle=3600)
+        return _engines[uri]
+
+
+def get_cache(uri):
+    '''
+    Returns the process wide SnapshotCache for uri.
+    '''
+    engine = get_engine(uri)
+    with _registry_lock:
+        if uri not in _caches:
+            _caches[uri] = SnapshotCache(uri, engine)
+        return _caches[uri]
+
+
+class SnapshotCache(object):
+    """
+    Latest weather and seeing rows of one CTIO database, shared by every instrument using the same URI.
+
+    Only one refresh runs at a time: callers arriving while a refresh is in flight wait for it and
+    get its result instead of issuing their own query.
+    """
+
+    def __init__(self, uri, engine):
+        self.uri = uri
+        self.engine = engine
+        self._cond = threading.Condition()
+        self._refreshing = False
+        self._generation = 0
+        self._snapshot = None
+        self._last_result = None
+        self.metrics = Metrics()
+
+    def _fetch(self):
+        with self.metrics.timer('connect_seconds'):
+            connection = self.engine.connect()
+        try:
+            with self.metrics.timer('query_seconds'):
+                row = connection.execute(SNAPSHOT_QUERY).fetchone()
+        finally:
+            connection.close()
+
+        weather = seeing = None
+        if row is not None and row['time'] is not None:
+            weather = (_as_datetime(row['time']), row['temp'], row['hum'], row['wspeed'], row['wdir'], row['pres'])
+        if row is not None and row['ut'] is not None:
+            seeing = (_as_datetime(row['ut']), float(row['seeing']), float(row['airmass']),
+                      float(row['flux_s1']) + float(row['flux_s2']))
+        return DBSnapshot(weather, seeing, time.time())
+
+    def get(self, max_age):
+        '''
+        Returns a DBSnapshot not older than max_age seconds, refreshing it if needed.
+        :param max_age: maximum age of the cached snapshot, in seconds.
+        :return: DBSnapshot or None if the database could not be queried.
+        '''
+        with self._cond:
+            snapshot = self._snapshot
+            if snapshot is not None and time.time() < snapshot.fetched_at + max_age:
+                self.metrics.inc('snapshot_hits')
+                return snapshot
+            if self._refreshing:
+                self.metrics.inc('snapshot_coalesced')
+                generation = self._generation
+                while self._generation == generation:
+                    self._cond.wait()
+                return self._last_result
+            self._refreshing = True
+
+        self.metrics.inc('snapshot_misses')
+        snapshot = None
+        try:
+            log.debug("Querying CTIO database %s..." % self.uri)
+            snapshot = self._fetch()
+        except Exception, e:
+            self.metrics.error(e)
+            log.error('Error querying URI %s: %s' % (self.uri, e))
+        finally:
+            with self._cond:
+                if snapshot is not None:
+                    self._snapshot = snapshot
+                self._last_result = snapshot
+                self._refreshing = False
+                self._generation += 1
+                self._cond.notify_all()
+
+        return snapshot
+
+
+def fetch_columns(engine, table, time_column, columns, since, chunk_size=10000):
+    '''
+    Streams every row of table newer than since through a server-side cursor, decoding each chunk straight into
+    column arrays.
+
+    :param table: weather or DIMM2_SEEING.
+    :param time_column: time or ut.
+    :param columns: names of the float columns to fetch.
+    :param since: watermark, only rows with time_column > since are fetched.
+    :param chunk_size: rows per fetchmany().
+    :return: (int64 microseconds since the epoch, dict column -> float32 array). NULLs are NaN.
+    '''
+    import sqlalchemy
+    query = sqlalchemy.text("select %s, %s from %s where %s > :since order by %s" % (
+        time_column, ', '.join(columns), table, time_column, time_column))
+
+    times = []
+    values = dict([(column, []) for column in columns])
+
+    connection = engine.connect().execution_options(stream_results=True)
+    try:
+        result = connection.execute(query, since=since)
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            chunk = zip(*rows)
+            times.append(np.array(chunk[0], dtype='datetime64[us]').astype(np.int64))
+            for i, column in enumerate(columns):
+                values[column].append(np.array(chunk[i + 1], dtype=np.float64).astype(np.float32))
+        result.close()
+    finally:
+        connection.close()
+
+    if not times:
+        return np.zeros(0, dtype=np.int64), dict([(column, np.zeros(0, dtype=np.float32)) for column in columns])
+    return np.concatenate(times), dict([(column, np.concatenate(values[column])) for column in columns])
+
+
+def fetch_weather(engine, since, chunk_size=10000):
+    '''
+    :return: fetch_columns of the weather table. Columns: temp, hum, wspeed, wdir, pres.
+    '''
+    return fetch_columns(engine, 'weather', 'time', WEATHER_COLUMNS, since, chunk_size)
+
+
+def fetch_seeing(engine, since, chunk_size=10000):
+    '''
+    :return: fetch_columns of the DIMM2_SEEING table. Columns: seeing, airmass, flux_s1, flux_s2.
+    '''
+    return fetch_columns(engine, 'DIMM2_SEEING', 'ut', SEEING_COLUMNS, since, chunk_size)
@@ -0,0 +1,109 @@
+import datetime
+import time
+
+import numpy as np
+
+from chimera_ctioenviroment.history import to_timestamp
+
+# keys of the ImageRequest, or keywords of the header cards it collected, holding the start of the exposure.
+START_KEYS = ('frameStart', 'DATE-OBS')
+
+
+def exposure_start(request):
+    '''
+    :param request: ImageRequest or None.
+    :return: start of the exposure in microseconds since the epoch or None if request does not carry it.
+    '''
+    if request is None:
+        return None
+    headers = dict([card[:2] for card in getattr(request, 'headers', None) or []])
+    for key in START_KEYS:
+        value = request.get(key, headers.get(key))
+        if value is None:
+            continue
+        if isinstance(value, basestring):
+            # FITS dates, e.g. 2017-03-01T01:02:03.456
+            value = value.replace('T', ' ')
+        try:
+            return to_timestamp(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def exposure_window(request, now=None):
+    '''
+    Exposure interval of an ImageRequest, from its start (see START_KEYS) and exptime.
+    :param request: ImageRequest or None.
+    :param now: time of the call in seconds since the epoch. Defaults to time.time().
+    :return: (start, end) in microseconds since the epoch or None if request has no exptime or start, or if the
+             exposure did not start yet, e.g. when the metadata is collected on beginExposure.
+    '''
+    try:
+        exptime = float(request['exptime'])
+    except (TypeError, KeyError, ValueError):
+        return None
+    start = exposure_start(request)
+    if start is None or start > int(round((time.time() if now is None else now) * 1e6)):
+        return None
+    return start, start + int(round(exptime * 1e6))
+
+
+def _unit(comment):
+    # '[degC] Weather station temperature' -> '[degC] '
+    if comment.startswith('['):
+        return comment[:comment.index(']') + 1] + ' '
+    return ''
+
+
+def _previous(x, t, v):
+    # reading of the latest sample not after x, or of the first one before the history starts, like np.interp.
+    return v[np.maximum(np.searchsorted(t, x, side='right') - 1, 0)]
+
+
+def align(cards, history, keywords, window, long_exposure, steps=(), date=None):
+    '''
+    Replaces the values of the header cards by the readings at the middle of the exposure, interpolated from the
+    buffered history. Exposures of at least long_exposure seconds also get <keyword>MN, <keyword>MX and <keyword>AV
+    cards with the minimum, maximum and mean readings during the exposure.
+
+    :param cards: FITS header cards of the latest snapshot.
+    :param history: history.History of the instrument, in the header units.
+    :param keywords: dict keyword -> quantity of the cards to align, e.g. ENVTEM -> temperature.
+    :param window: (start, end) of the exposure, in microseconds since the epoch. See exposure_window.
+    :param long_exposure: in seconds.
+    :param steps: keywords of quantities which are not interpolated, e.g. flags, but held from the previous sample.
+    :param date: keyword of the card with the UT time of the readings, e.g. ENVDAT. It is set to the middle of the
+                 exposure when the readings are taken from there.
+    :return: list of FITS header cards.
+    '''
+    start, end = window
+    middle = (start + end) // 2
+    stats = end - start >= long_exposure * 1e6
+
+    aligned = []
+    extra = []
+    interpolated = False
+    for keyword, value, comment in cards:
+        quantity = keywords.get(keyword)
+        if quantity is not None:
+            t, v = history.query(quantity)
+            sample = _previous if keyword in steps else np.interp
+            if len(t):
+                # past the latest reading the snapshot value is kept, it is not rounded to float32.
+                if middle < t[-1]:
+                    value = float(sample(middle, t, v))
+                    interpolated = True
+                if stats:
+                    i, j = np.searchsorted(t, (start, end), side='right')
+                    during = np.concatenate((sample((start, end), t, v), v[i:j]))
+                    unit = _unit(comment)
+                    extra.extend([(keyword + 'MN', float(during.min()), unit + 'Minimum during the exposure'),
+                                  (keyword + 'MX', float(during.max()), unit + 'Maximum during the exposure'),
+                                  (keyword + 'AV', float(during.mean()), unit + 'Mean during the exposure')])
+        aligned.append((keyword, value, comment))
+    if interpolated and date is not None:
+        when = datetime.datetime.utcfromtimestamp(middle / 1e6).strftime('%Y-%m-%dT%H:%M:%S.%f')
+        aligned = [(date, when, 'UT time of the values, middle of the exposure') if card[0] == date else card
+                   for card in aligned]
+    return aligned + extra
@@ -0,0 +1,394 @@
+import datetime
+import json
+import mmap
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from chimera_ctioenviroment.history import History, RingBuffer, to_timestamp
+from chimera_ctioenviroment.snapshot import Snapshot
+
+# 'CTIOENV1', layout version included.
+MAGIC = 0x31564e454f495443
+
+# int64 fields of the segment header.
+_MAGIC, _SEQ, _CAPACITY, _QUANTITIES, _BLOB_SIZE, _RETIRED, _PID = range(7)
+_META_SIZE = 8 * 8
+_NAME_SIZE = 32
+# snapshot fields: obs_time (int64), created, expires, checked (float64), header length (int64).
+_OBS_TIME, _CREATED, _EXPIRES, _CHECKED, _BLOB_LENGTH = range(5)
+_SNAPSHOT_SIZE = 5 * 8
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class Segment(object):
+    """
+    Memory mapped file with the latest snapshot of one instrument and a ring buffer per quantity, shared by one
+    writer process and any number of readers.
+
+    The writer increments the sequence number before and after every change, so it is odd while a write is in
+    progress. Readers never lock: they retry until they read the same even sequence number before and after
+    reading (a seqlock).
+
+    Layout: header (int64 x 8), quantity names (32 bytes each), snapshot fields, snapshot values (float64 per
+    quantity), JSON FITS header cards (blob_size bytes), then per quantity head and count (int64 x 2), timestamps
+    (int64 x 2 capacity) and values (float32 x 2 capacity), mirrored as in history.RingBuffer.
+    """
+
+    def __init__(self, mm, writable):
+        self.mmap = mm
+        self.writable = writable
+        self.lock = threading.RLock()
+        self._depth = 0
+        self._meta = np.frombuffer(mm, np.int64, 8, 0)
+        if self._meta[_MAGIC] != MAGIC:
+            raise IOError('Not a shared feed segment or a different layout version.')
+        self.capacity = int(self._meta[_CAPACITY])
+        self.blob_size = int(self._meta[_BLOB_SIZE])
+        n = int(self._meta[_QUANTITIES])
+        self.quantities = [mm[_META_SIZE + i * _NAME_SIZE:_META_SIZE + (i + 1) * _NAME_SIZE].rstrip('\0')
+                           for i in range(n)]
+
+        offset = _META_SIZE + n * _NAME_SIZE
+        self._snapshot = np.frombuffer(mm, np.int64, 5, offset)
+        self._times = self._snapshot.view(np.float64)
+        self._values = np.frombuffer(mm, np.float64, n, offset + _SNAPSHOT_SIZE)
+        self._blob = offset + _SNAPSHOT_SIZE + 8 * n
+        offset = self._blob + self.blob_size
+        self.rings = dict()
+        for quantity in self.quantities:
+            self.rings[quantity] = SharedRingBuffer(self, offset)
+            offset += 16 + 24 * self.capacity
+
+    @staticmethod
+    def size(quantities, capacity, blob_size):
+        n = len(quantities)
+        return _META_SIZE + n * _NAME_SIZE + _SNAPSHOT_SIZE + 8 * n + blob_size + n * (16 + 24 * capacity)
+
+    @classmethod
+    def create(cls, path, quantities, capacity, blob_size=16384):
+        '''
+        Creates a new segment and atomically replaces the one on path, which is marked as retired so its readers
+        map the new one.
+        :param quantities: names of the quantities.
+        :param capacity: samples kept per quantity.
+        :param blob_size: maximum size of the JSON encoded FITS header cards, in bytes.
+        '''
+        path = os.path.expanduser(path)
+        quantities = sorted(quantities)
+        blob_size = (blob_size + 7) // 8 * 8
+        size = cls.size(quantities, capacity, blob_size)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.' + os.path.basename(path))
+        try:
+            os.fchmod(fd, 0644)
+            os.ftruncate(fd, size)
+            mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        meta = np.frombuffer(mm, np.int64, 8, 0)
+        meta[_CAPACITY] = capacity
+        meta[_QUANTITIES] = len(quantities)
+        meta[_BLOB_SIZE] = blob_size
+        meta[_PID] = os.getpid()
+        for i, quantity in enumerate(quantities):
+            if len(quantity) > _NAME_SIZE:
+                raise ValueError('Quantity name too long: %s' % quantity)
+            mm[_META_SIZE + i * _NAME_SIZE:_META_SIZE + i * _NAME_SIZE + len(quantity)] = quantity
+        meta[_MAGIC] = MAGIC
+
+        previous = None
+        try:
+            previous = cls.open(path)
+        except (IOError, OSError, ValueError):
+            pass
+        os.rename(tmp, path)
+        if previous is not None:
+            previous._meta[_RETIRED] = 1
+        return cls(mm, True)
+
+    @classmethod
+    def open(cls, path, writable=True):
+        '''
+        Maps an existing segment. Readers map it read-only.
+        '''
+        fd = os.open(os.path.expanduser(path), os.O_RDWR if writable else os.O_RDONLY)
+        try:
+            size = os.fstat(fd).st_size
+            mm = mmap.mmap(fd, size, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        return cls(mm, writable)
+
+    @property
+    def retired(self):
+        return bool(self._meta[_RETIRED])
+
+    def writing(self):
+        '''
+        Context manager around the writes of the single writer. Nested writes share the same sequence increment.
+        '''
+        return _Writing(self)
+
+    def read(self, function, timeout=1.):
+        '''
+        :return: function(), retried until it did not overlap a write.
+        :raise IOError: if a write seems to be stuck for timeout seconds, e.g. the writer died in the middle of it.
+        '''
+        if self.writable:
+            with self.lock:
+                return function()
+        deadline = None
+        while True:
+            seq = int(self._meta[_SEQ])
+            if not seq & 1:
+                try:
+                    result = function()
+                except Exception:
+                    if int(self._meta[_SEQ]) == seq:
+                        raise
+                    continue
+                if int(self._meta[_SEQ]) == seq:
+                    return result
+            elif deadline is None:
+                deadline = time.time() + timeout
+            elif time.time() > deadline:
+                raise IOError('Shared feed write in progress for more than %s s.' % timeout)
+
+    def sequence(self):
+        return int(self._meta[_SEQ])
+
+    def write_snapshot(self, snapshot, checked):
+        '''
+        :param snapshot: snapshot.Snapshot. Quantities of the segment missing on it are written as NaN.
+        :param checked: time.time() the source was last checked.
+        '''
+        blob = json.dumps([list(card) for card in snapshot.header], default=float)
+        if len(blob) > self.blob_size:
+            raise ValueError('Header of %d bytes does not fit on %d bytes.' % (len(blob), self.blob_size))
+        values = [snapshot.values.get(quantity) for quantity in self.quantities]
+        with self.writing():
+            self._snapshot[_OBS_TIME] = to_timestamp(snapshot.obs_time)
+            self._times[_CREATED] = snapshot.created
+            self._times[_EXPIRES] = np.nan if snapshot.expires is None else snapshot.expires
+            self._times[_CHECKED] = checked
+            self._values[:] = [np.nan if value is None else value for value in values]
+            self.mmap[self._blob:self._blob + len(blob)] = blob
+            self._snapshot[_BLOB_LENGTH] = len(blob)
+
+    def touch(self, checked):
+        '''
+        Updates the time the source was last checked, when it had nothing new.
+        '''
+        with self.writing():
+            self._times[_CHECKED] = checked
+
+    def read_snapshot(self):
+        '''
+        :return: (obs_time, values, created, expires, checked, header) as raw copies, or None if there is none.
+        '''
+        length = int(self._snapshot[_BLOB_LENGTH])
+        if not length:
+            return None
+        return (int(self._snapshot[_OBS_TIME]), self._values.tolist(), float(self._times[_CREATED]),
+                float(self._times[_EXPIRES]), float(self._times[_CHECKED]), self.mmap[self._blob:self._blob + length])
+
+
+class _Writing(object):
+    __slots__ = ('segment',)
+
+    def __init__(self, segment):
+        self.segment = segment
+
+    def __enter__(self):
+        segment = self.segment
+        segment.lock.acquire()
+        segment._depth += 1
+        if segment._depth == 1:
+            segment._meta[_SEQ] += 1
+
+    def __exit__(self, *exc):
+        segment = self.segment
+        segment._depth -= 1
+        if segment._depth == 0:
+            segment._meta[_SEQ] += 1
+        segment.lock.release()
+
+
+class SharedRingBuffer(RingBuffer):
+    """
+    RingBuffer living on a Segment. Writes are done under its seqlock, and reads are retried when they overlap one.
+    """
+
+    def __init__(self, segment, offset):
+        self.capacity = segment.capacity
+        self._segment = segment
+        self._lock = segment.lock
+        self._state = np.frombuffer(segment.mmap, np.int64, 2, offset)
+        self._t = np.frombuffer(segment.mmap, np.int64, 2 * self.capacity, offset + 16)
+        self._v = np.frombuffer(segment.mmap, np.float32, 2 * self.capacity, offset + 16 + 16 * self.capacity)
+
+    def _get_head(self):
+        return int(self._state[0])
+
+    def _set_head(self, head):
+        self._state[0] = head
+
+    def _get_count(self):
+        return int(self._state[1])
+
+    def _set_count(self, count):
+        self._state[1] = count
+
+    _head = property(_get_head, _set_head)
+    _count = property(_get_count, _set_count)
+
+    def append(self, t, value):
+        with self._segment.writing():
+            return RingBuffer.append(self, t, value)
+
+    def extend(self, t, values):
+        with self._segment.writing():
+            return RingBuffer.extend(self, t, values)
+
+    def last(self):
+        return self._segment.read(lambda: RingBuffer.last(self))
+
+    def query(self, since=None, until=None):
+        # RingBuffer.query copies the samples inside read(), so a copy overlapping a write is discarded and retried.
+        return self._segment.read(lambda: RingBuffer.query(self, since, until))
+
+
+class SharedHistory(History):
+    """
+    History on the ring buffers of a Segment. Quantities not on the segment are kept on private buffers.
+    """
+
+    def __init__(self, segment):
+        History.__init__(self, segment.capacity)
+        self._buffers.update(segment.rings)
+
+
+class FeedWriter(object):
+    """
+    Publishes the snapshots and history of an instrument on a Segment.
+    """
+
+    def __init__(self, path, quantities, capacity):
+        self.path = path
+        self.segment = Segment.create(path, quantities, capacity)
+        self.history = SharedHistory(self.segment)
+
+    def publish(self, snapshot, checked=None):
+        '''
+        :param checked: time.time() the source was last checked. Defaults to the creation of snapshot.
+        '''
+        self.segment.write_snapshot(snapshot, snapshot.created if checked is None else checked)
+
+    def touch(self, checked):
+        self.segment.touch(checked)
+
+
+class FeedReader(object):
+    """
+    Reads the snapshots and history published by a FeedWriter on another process, without any I/O: snapshots are
+    decoded once per update and history queries return copies of the shared memory, checked against concurrent
+    writes.
+
+    The segment is mapped on first use and mapped again when the writer replaces it, e.g. after a restart.
+    """
+
+    def __init__(self, path, units, retry=1.):
+        '''
+        :param units: dict quantity -> astropy unit of the published values.
+        :param retry: minimum time between attempts to map a missing segment. in seconds.
+        '''
+        self.path = path
+        self.units = units
+        self.retry = retry
+        self.history = _ReaderHistory(self)
+        self._segment = None
+        self._next_open = 0
+        self._seq = None
+        self._snapshot = None, 0.
+        self._lock = threading.Lock()
+
+    def segment(self):
+        '''
+        :return: the current Segment or None if there is none.
+        '''
+        segment = self._segment
+        if segment is not None and not segment.retired:
+            return segment
+        with self._lock:
+            if self._segment is not segment:
+                return self._segment
+            if time.time() < self._next_open:
+                return None
+            try:
+                self._segment = Segment.open(self.path, writable=False)
+            except (IOError, OSError, ValueError):
+                self._segment = None
+                self._next_open = time.time() + self.retry
+            self._seq = None
+            return self._segment
+
+    def snapshot(self):
+        '''
+        :return: (snapshot.Snapshot, time.time() the source was last checked) or (None, 0.).
+        '''
+        segment = self.segment()
+        if segment is None:
+            return None, 0.
+        seq = segment.sequence()
+        if seq != self._seq:
+            try:
+                raw = segment.read(segment.read_snapshot)
+            except IOError:
+                return None, 0.
+            self._snapshot = self._decode(segment, raw)
+            self._seq = seq
+        return self._snapshot
+
+    def _decode(self, segment, raw):
+        if raw is None:
+            return None, 0.
+        obs_time, values, created, expires, checked, blob = raw
+        header = [tuple([x.encode('utf-8') if isinstance(x, unicode) else x for x in card])
+                  for card in json.loads(blob)]
+        snapshot = Snapshot(_EPOCH + datetime.timedelta(microseconds=obs_time),
+                            dict(zip(segment.quantities, values)), self.units, header, created,
+                            None if np.isnan(expires) else expires)
+        return snapshot, checked
+
+
+class _ReaderHistory(object):
+    """
+    History interface of the current segment of a FeedReader.
+    """
+
+    def __init__(self, reader):
+        self._reader = reader
+        self.capacity = 0
+
+    def quantities(self):
+        segment = self._reader.segment()
+        return [] if segment is None else list(segment.quantities)
+
+    def last_timestamp(self):
+        segment = self._reader.segment()
+        if segment is None:
+            return None
+        last = [ring.last() for ring in segment.rings.values()]
+        last = [l[0] for l in last if l is not None]
+        return max(last) if last else None
+
+    def query(self, quantity, since=None, until=None):
+        segment = self._reader.segment()
+        if segment is None or quantity not in segment.rings:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return segment.rings[quantity].query(None if since is None else to_timestamp(since),
+                                             None if until is None else to_timestamp(until))
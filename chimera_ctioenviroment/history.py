@@ -0,0 +1,160 @@
+import calendar
+import datetime
+import threading
+
+import numpy as np
+
+
+def to_timestamp(t):
+    '''
+    Converts t to integer microseconds since the epoch.
+    :param t: naive UT datetime, "%Y-%m-%d %H:%M:%S[.%f]" string or seconds since the epoch.
+    '''
+    if isinstance(t, basestring):
+        t = datetime.datetime.strptime(t, '%Y-%m-%d %H:%M:%S.%f' if '.' in t else '%Y-%m-%d %H:%M:%S')
+    if isinstance(t, datetime.datetime):
+        return calendar.timegm(t.utctimetuple()) * 1000000 + t.microsecond
+    return int(round(t * 1e6))
+
+
+class RingBuffer(object):
+    """
+    Fixed capacity time series of (int64 microseconds, float32 value) samples.
+
+    Every sample is written twice, at i and i + capacity, so the latest samples always are a contiguous region
+    of the arrays. Queries copy that region under the lock, so appends never change an array already returned.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._t = np.zeros(2 * capacity, dtype=np.int64)
+        self._v = np.zeros(2 * capacity, dtype=np.float32)
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, t, value):
+        '''
+        Appends a sample. Samples not newer than the last one are ignored.
+        :param t: microseconds since the epoch.
+        :return: True if the sample was appended.
+        '''
+        with self._lock:
+            if self._count and t <= self._t[self._head + self.capacity - 1]:
+                return False
+            i = self._head
+            self._t[i] = self._t[i + self.capacity] = t
+            self._v[i] = self._v[i + self.capacity] = value
+            self._head = (i + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            return True
+
+    def extend(self, t, values):
+        '''
+        Appends many samples at once. Samples not newer than the last one are ignored.
+        :param t: sorted int64 array, microseconds since the epoch.
+        :param values: array of values.
+        :return: number of samples appended.
+        '''
+        with self._lock:
+            if self._count:
+                start = np.searchsorted(t, self._t[self._head + self.capacity - 1], 'right')
+                t, values = t[start:], values[start:]
+            t, values = t[-self.capacity:], values[-self.capacity:]
+            n = len(t)
+            if not n:
+                return 0
+            # positions head .. head + n - 1 (mod capacity), written on both halves.
+            first = min(n, self.capacity - self._head)
+            for offset in (0, self.capacity):
+                self._t[offset + self._head:offset + self._head + first] = t[:first]
+                self._v[offset + self._head:offset + self._head + first] = values[:first]
+                self._t[offset:offset + n - first] = t[first:]
+                self._v[offset:offset + n - first] = values[first:]
+            self._head = (self._head + n) % self.capacity
+            self._count = min(self._count + n, self.capacity)
+            return n
+
+    def last(self):
+        '''
+        :return: (t, value) of the latest sample or None.
+        '''
+        with self._lock:
+            if not self._count:
+                return None
+            i = self._head + self.capacity - 1
+            return int(self._t[i]), float(self._v[i])
+
+    def query(self, since=None, until=None):
+        '''
+        :param since: lower bound (inclusive), microseconds since the epoch.
+        :param until: upper bound (inclusive), microseconds since the epoch.
+        :return: (timestamps, values) arrays, oldest first.
+        '''
+        with self._lock:
+            end = self._head + self.capacity
+            t = self._t[end - self._count:end]
+            v = self._v[end - self._count:end]
+            lo = 0 if since is None else np.searchsorted(t, since, 'left')
+            hi = len(t) if until is None else np.searchsorted(t, until, 'right')
+            return t[lo:hi].copy(), v[lo:hi].copy()
+
+
+class History(object):
+    """
+    One RingBuffer per quantity.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buffers = dict()
+
+    def quantities(self):
+        return self._buffers.keys()
+
+    def buffer(self, quantity):
+        try:
+            return self._buffers[quantity]
+        except KeyError:
+            return self._buffers.setdefault(quantity, RingBuffer(self.capacity))
+
+    def append(self, t, values):
+        '''
+        :param t: time of the readings, see to_timestamp.
+        :param values: dict quantity -> value. None values are skipped.
+        '''
+        t = to_timestamp(t)
+        for quantity, value in values.iteritems():
+            if value is not None:
+                self.buffer(quantity).append(t, value)
+
+    def extend(self, t, values):
+        '''
+        :param t: sorted int64 array, microseconds since the epoch.
+        :param values: dict quantity -> array of values. NaNs are skipped.
+        '''
+        for quantity, value in values.iteritems():
+            valid = ~np.isnan(value)
+            self.buffer(quantity).extend(t[valid], value[valid])
+
+    def last_timestamp(self):
+        '''
+        :return: latest timestamp of all quantities, in microseconds since the epoch, or None.
+        '''
+        last = [buf.last() for buf in self._buffers.values()]
+        last = [l[0] for l in last if l is not None]
+        return max(last) if last else None
+
+    def query(self, quantity, since=None, until=None):
+        '''
+        :param since: lower bound, see to_timestamp.
+        :param until: upper bound, see to_timestamp.
+        :return: (timestamps in microseconds since the epoch, values) arrays, oldest first.
+        '''
+        if quantity not in self._buffers:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return self._buffers[quantity].query(None if since is None else to_timestamp(since),
+                                             None if until is None else to_timestamp(until))
@@ -1,17 +1,35 @@
 # coding=utf-8
+import codecs
 import datetime
+import hashlib
 import json
 import re
 import time
-import requests
-import xmltodict
+from multiprocessing.pool import ThreadPool
+
 from astropy import units
 from chimera.core.exceptions import OptionConversionException
 from chimera.instruments.weatherstation import WeatherBase
 from chimera.interfaces.weatherstation import WeatherTransparency, WeatherTemperature, WeatherHumidity, WeatherPressure, \
     WeatherWind, WSValue
 from chimera.util.image import ImageUtil
-from requests.exceptions import ConnectTimeout, ReadTimeout, ConnectionError
+
+from chimera_ctioenviroment import conversion
+from chimera_ctioenviroment.conversion import M_S, MMHG
+from chimera_ctioenviroment.history import to_timestamp
+from chimera_ctioenviroment.metrics import Metrics
+from chimera_ctioenviroment.poller import get_poller
+from chimera_ctioenviroment.rolling import RollingStats
+from chimera_ctioenviroment.snapshot import Snapshot
+from chimera_ctioenviroment.source import SnapshotSource
+from chimera_ctioenviroment.thresholds import ReadingEvents, ChangeDetector
+
+# units of the Snapshot values, the same used on the FITS headers.
+UNITS = dict(humidity=units.pct, temperature=units.Celsius, wind_speed=M_S, wind_direction=units.deg,
+             dew_point=units.Celsius, pressure=MMHG, sky_transparency=units.pct)
+
+# cards aligned to the exposure by getMetadata.
+KEYWORDS = dict(ENVTEM='temperature', ENVDEW='dew_point', ENVHUM='humidity', ENVWIN='wind_speed', ENVPRE='pressure')
 
 wind_dir = {'E': 90.0, 'ENE': 67.5, 'ESE': 112.5, 'N': 0.0, 'NE': 45.0, 'NNE': 22.5, 'NNW': 337.5, 'NW': 315.0,
             'S': 180.0, 'SE': 135.0, 'SSE': 157.5, 'SSW': 202.5, 'SW': 225.0, 'W': 270.0, 'WNW': 292.5, 'WSW': 247.5}
@@ -29,212 +47,526 @@ def wind_direction(wind_dir_letters):
     return direction
 
 
-class LCOGTScrapper(object):
+def unique(items):
     """
-    Web scrapper for the LCOGT telops page
+    :return: items without repetitions, in their first order.
     """
+    seen = set()
+    return [item for item in items if not (item in seen or seen.add(item))]
 
-    def scrape(self):
 
-        results = dict()
-
-        _base_url = "https://weather-api.lco.global/query?site=lsc&datumname="
-        urls = {'humidity': _base_url + "Weather%20Humidity%20Value",
-                'temperature': _base_url + "Weather%20Air%20Temperature%20Value",
-                'wind_speed': _base_url + "Weather%20Wind%20Speed%20Value",
-                'wind_direction': _base_url + "Weather%20Wind%20Direction%20Value",
-                'dew_point': _base_url + "Weather%20Dew%20Point%20Value",
-                'pressure': _base_url + "Weather%20Barometric%20Pressure%20Value",
-                'sky_transparency': _base_url + "Boltwood%20Transparency%20Measure"
-                }
-
-        for key in urls.keys():
+def last_element(chunks):
+    """
+    Incrementally parses a JSON array, keeping only its last element in memory.
+    :param chunks: Iterable over the raw (utf-8 encoded) response body.
+    :return: The last element of the array or None if it is empty.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buf = u''
+    pos = 0
+    started = False
+    last = None
+    chunks = iter(chunks)
+    eof = False
+
+    while True:
+        while pos < len(buf) and buf[pos] in u' \t\r\n,':
+            pos += 1
+        if pos < len(buf):
+            if not started:
+                if buf[pos] != u'[':
+                    raise ValueError('Response is not a JSON array')
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == u']':
+                return last
             try:
-                results[key] = requests.get(urls[key]).json()[-1]
-            except:
-                results[key] = {u'TimeStamp': u'',
-                                     u'TimeStampMeasured': u'',
-                                     u'Value': None,
-                                     u'ValueString': u''}
+                element, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                end = None
+            # a value touching the end of the buffer may still be incomplete
+            if end is not None and (end < len(buf) or eof):
+                last = element
+                buf, pos = buf[end:], 0
+                continue
+        if eof:
+            raise ValueError('Truncated JSON array')
+        try:
+            buf += text_decoder.decode(next(chunks))
+        except StopIteration:
+            buf += text_decoder.decode(b'', True)
+            eof = True
+
 
-        return results
+class LCOGTScrapper(object):
+    """
+    Web scrapper for the LCOGT telops page
+    """
 
+    base_url = "https://weather-api.lco.global/query?site=lsc&datumname="
+    since_param = 'start'
+    chunk_size = 8192
+    datums = {'humidity': "Weather%20Humidity%20Value",
+              'temperature': "Weather%20Air%20Temperature%20Value",
+              'wind_speed': "Weather%20Wind%20Speed%20Value",
+              'wind_direction': "Weather%20Wind%20Direction%20Value",
+              'dew_point': "Weather%20Dew%20Point%20Value",
+              'pressure': "Weather%20Barometric%20Pressure%20Value",
+              'sky_transparency': "Boltwood%20Transparency%20Measure"
+              }
+
+    def __init__(self, concurrent=True, timeout=10., deadline=15., incremental=True, base_url=None, metrics=None,
+                 session=None, pool=None, sites=None, keys=None):
+        """
+        :param concurrent: Query all the datums at the same time instead of one after the other.
+        :param timeout: Timeout of each HTTP request, in seconds.
+        :param deadline: Maximum time spent on a whole concurrent scrape, in seconds.
+        :param incremental: Only ask for data newer than the last one seen and stream-parse the answer.
+        :param base_url: Query URL, up to the datum name. Defaults to the LCOGT weather API for LSC.
+        :param metrics: Metrics where the request latencies and errors are recorded.
+        :param session: requests.Session to query through. Defaults to a new one.
+        :param pool: ThreadPool running the concurrent queries. Defaults to a new one.
+        :param sites: LCOGT sites queried, replacing the site parameter of base_url. Defaults to that site.
+        :param keys: keys of datums queried on every site. Defaults to all of them.
+        """
+        self.metrics = metrics or Metrics()
+        if base_url:
+            self.base_url = base_url
+        site = re.search(r'site=([^&]*)', self.base_url)
+        self.sites = unique(sites or [site.group(1) if site else ''])
+        if site is None and self.sites != ['']:
+            raise ValueError('URL %s has no site parameter.' % self.base_url)
+        keys = unique(keys or sorted(self.datums))
+        for key in keys:
+            if key not in self.datums:
+                raise ValueError('Unknown LCOGT datum %s.' % key)
+        # one batch of (site, key) requests per scrape.
+        self.requests = [(site, key) for site in self.sites for key in keys]
+        self._urls = dict([((site, key), re.sub(r'site=[^&]*', 'site=' + site, self.base_url, 1) + self.datums[key])
+                           for site, key in self.requests])
+        self.concurrent = concurrent
+        self.incremental = incremental
+        self.timeout = timeout
+        self.deadline = deadline
+
+        # a session or pool given by the caller is shared, close() leaves it alone.
+        self._own_session = session is None
+        if session is None:
+            import requests.adapters
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=len(self.requests))
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self._session = session
+        self._own_pool = concurrent and pool is None
+        if self._own_pool:
+            pool = ThreadPool(len(self.requests))
+        self._pool = pool if concurrent else None
+        self._last = dict()
+        # (digest, latest datum) of the last body parsed for each request, kept even if the scrape dropped it.
+        self._digests = dict()
+        # datums which failed on the last scrape, and their (site, key) requests.
+        self.failures = 0
+        self.failed = []
+
+    def close(self):
+        if self._own_pool and self._pool is not None:
+            self._pool.terminate()
+        self._pool = None
+        if self._own_session:
+            self._session.close()
+
+    def _get(self, request):
+        if not self.incremental:
+            with self.metrics.timer('http_seconds'):
+                response = self._session.get(self._urls[request], timeout=self.timeout)
+            response.raise_for_status()
+            # an identical body is not parsed again. Its datum is cached here because scrape drops the results
+            # which miss the deadline.
+            digest = hashlib.sha1(response.content).digest()
+            cached = self._digests.get(request)
+            if cached is not None and cached[0] == digest:
+                return cached[1]
+            with self.metrics.timer('parse_seconds'):
+                latest = response.json()[-1]
+            self._digests[request] = (digest, latest)
+            return latest
+
+        params = None
+        since = self._previous(request)['TimeStamp']
+        if since:
+            params = {self.since_param: since}
+        with self.metrics.timer('http_seconds'):
+            response = self._session.get(self._urls[request], params=params, timeout=self.timeout, stream=True)
+        try:
+            response.raise_for_status()
+            # the body is read while parsing.
+            with self.metrics.timer('parse_seconds'):
+                latest = last_element(response.iter_content(self.chunk_size))
+        finally:
+            response.close()
+
+        if latest is None:
+            return self._previous(request)
+        return latest
+
+    def _previous(self, request):
+        return self._last.get(request, {u'TimeStamp': u'',
+                                    u'TimeStampMeasured': u'',
+                                    u'Value': None,
+                                    u'ValueString': u''})
 
-class LCOGTWeather(WeatherBase, WeatherTemperature, WeatherHumidity, WeatherPressure,
-                   WeatherWind, WeatherTransparency):
+    def scrape(self):
+        """
+        Queries every datum of every site as one batch. Datums which fail or miss the deadline keep their previous
+        value.
+        :return: dict site -> dict with the latest value of each datum, of the sites with any datum changed, or None
+                 if none of them changed.
+        """
+
+        results = dict()
+        failed = []
+        t0 = time.time()
+
+        if self._pool is None:
+            for request in self.requests:
+                try:
+                    results[request] = self._get(request)
+                except Exception, e:
+                    self.metrics.error(e)
+                    failed.append(request)
+                    results[request] = self._previous(request)
+        else:
+            pending = [(request, self._pool.apply_async(self._get, (request,))) for request in self.requests]
+            deadline = time.time() + self.deadline
+            for request, result in pending:
+                try:
+                    results[request] = result.get(max(0., deadline - time.time()))
+                except Exception, e:
+                    self.metrics.error(e)
+                    failed.append(request)
+                    results[request] = self._previous(request)
+
+        self.metrics.observe('scrape_seconds', time.time() - t0)
+        self.failures = len(failed)
+        self.failed = failed
+
+        scrape = dict()
+        for request, result in results.iteritems():
+            site, key = request
+            scrape.setdefault(site, dict())[key] = result
+        changed = set([site for (site, key), result in results.iteritems()
+                       if result['TimeStamp'] != self._previous((site, key))['TimeStamp']])
+        self._last = results
+        if not changed:
+            return None
+        return dict([(site, scrape[site]) for site in changed])
+
+
+class LCOGTWeather(SnapshotSource, WeatherBase, WeatherTemperature, WeatherHumidity, WeatherPressure,
+                   WeatherWind, WeatherTransparency, ReadingEvents):
     """
     Instrument that gets information from LCOGT web page
     """
 
     __config__ = dict(
         model="LCOGT weather",
+        url=LCOGTScrapper.base_url,
+        sites=["lsc"],  # the first site feeds the headers, history and events, every site the site= accessors
+        datums=[],  # quantities scraped on every site, e.g. ["temperature", "humidity"]. empty for all of them
+        concurrent=True,  # query all the datums at the same time
+        request_timeout=10.,  # in seconds
+        scrape_deadline=15.,  # in seconds
+        incremental=True,  # only fetch data newer than the last seen
+        history_size=4096,  # readings kept in memory per quantity
+        cache_path="~/.chimera/lcogtweather-{source}.sqlite",  # kept across restarts. empty to disable
+        cache_max_age=15 * 60,  # maximum age of a cached reading to be served. in seconds
+        exposure_aligned=True,  # header values at the middle of the exposure, from the history
+        long_exposure=60,  # exposures at least this long get min/max/mean cards. in seconds
+        poll_interval=120.,  # in seconds. used when adaptive_schedule is off
+        adaptive_schedule=True,  # learn the publish period of LCOGT and scrape right after each sample
+        min_poll_interval=30.,  # in seconds
+        max_poll_interval=10 * 60.,  # in seconds
+        max_backoff=10 * 60.,  # maximum interval while LCOGT is failing. in seconds
+        max_staleness=20 * 60,  # snapshots of sites checked longer ago are never served. in seconds
+        temperature_deadband=1.,  # readingChanged when the temperature moves this much. in degC
+        humidity_deadband=5.,  # in %
+        humidity_limit=85.,  # thresholdCrossed when the humidity crosses it. in %. 0 to disable
+        wind_speed_deadband=1.,  # in m/s
+        wind_speed_limit=14.,  # in m/s. 0 to disable
+        sky_transparency_deadband=10.,  # in %
+        stats_windows=[10 * 60, 60 * 60],  # rolling statistics windows. in seconds
+        shared_feed="",  # "publish" the readings on shared_feed_path or "read" them from there
+        shared_feed_path="/dev/shm/chimera-lcogtweather",
+        record_path="",  # append the scrapes to this compressed log. empty to disable
+        replay=False,  # fed by a replay.Replayer instead of LCOGT
+        archive_path="",  # long term columnar archive directory, see archive.Archive. empty to disable
+        archive_interval=10 * 60,  # in seconds
     )
 
+    _units = UNITS
+    _keywords = KEYWORDS
+    _source_options = ('url', 'sites')
+    _date_keyword = 'ENVDAT'
+
+    def __init__(self):
+        WeatherBase.__init__(self)
+        SnapshotSource.__init__(self)
+        self._results = None
+        self._site = None
+        # latest Snapshot of every site and time.time() it was last checked.
+        self._site_snapshots = dict()
+        self._site_checks = dict()
+        self._scrapper = None
+
     def __start__(self):
         """
-        Start a thread that will be querying the LCGOT forever and ever...
+        Schedule the LCOGT scrapes on the poller shared by every HTTP source.
         """
-        self.__stop = False
-        self._results = None
-        self._scrapper = LCOGTScrapper()
-        self.setHz(1. / 120)
+        self._site = self['sites'][0] if self['sites'] else None
+        self._stats = RollingStats([q for q in UNITS if q != 'wind_direction'], self['stats_windows'],
+                                   self['history_size'])
+        self._changes = ChangeDetector(deadbands=dict(temperature=self['temperature_deadband'],
+                                                      humidity=self['humidity_deadband'],
+                                                      wind_speed=self['wind_speed_deadband'],
+                                                      sky_transparency=self['sky_transparency_deadband']),
+                                       limits=dict(humidity=self['humidity_limit'],
+                                                   wind_speed=self['wind_speed_limit']))
+        if not self._open() or self['replay']:
+            return
+        poller = get_poller()
+        self._scrapper = LCOGTScrapper(concurrent=self['concurrent'], timeout=self['request_timeout'],
+                                       deadline=self['scrape_deadline'], incremental=self['incremental'],
+                                       base_url=self['url'], metrics=self._metrics, session=poller.session,
+                                       pool=poller.pool, sites=self['sites'], keys=self['datums'])
+        self._site = self._scrapper.sites[0]
+        self._schedule = self._adaptive_schedule('poll_interval', 'min_poll_interval', 'max_poll_interval')
+        self._job = poller.schedule(self._poll, name='LCOGTWeather')
 
     def __stop__(self):
-        self.__stop = True
-
-    def _update(self, value):
+        SnapshotSource.__stop__(self)
+        if self._scrapper is not None:
+            self._scrapper.close()
+
+    def _restore(self):
+        restored = SnapshotSource._restore(self)
+        if restored:
+            self._site_snapshots[self._site] = self._snapshot
+            self._site_checks[self._site] = self._last_check
+        return restored
+
+    def _current(self, site=None):
+        """
+        Returns the current Snapshot of site, by default the first one, or None if there is no valid data.
+        """
+        if site is None or site == self._site:
+            return SnapshotSource._current(self)
+        if site not in self['sites']:
+            raise ValueError('Unknown LCOGT site %s.' % site)
+        self._metrics.inc('cache_hits')
+        snapshot = self._site_snapshots.get(site)
+        if self._fresh(snapshot, self._site_checks.get(site, 0)):
+            return snapshot
+        return None
+
+    def _make_snapshot(self, results):
+        values = dict()
+        for key in UNITS.keys():
+            value = results[key]['Value'] if key in results else None
+            values[key] = float(value) if value is not None else None
+        return self._build_snapshot(results['utctime'], values)
+
+    def _build_snapshot(self, utctime, values, created=None, expires=None):
+        header = [('ENVMOD', str(self['model']), 'Weather station Model'),
+                  ('ENVTEM', values['temperature'], '[degC] Weather station temperature'),
+                  ('ENVDEW', values['dew_point'], '[degC] Weather station dew point temperature'),
+                  ('ENVHUM', values['humidity'], '[%] Weather station relative humidity'),
+                  ('ENVWIN', values['wind_speed'], '[m/s] Weather station wind speed'),
+                  ('ENVDIR', values['wind_direction'], '[deg] Weather station wind direction'),
+                  ('ENVPRE', values['pressure'], '[mmHg] Weather station air pressure'),
+                  ('ENVDAT', ImageUtil.formatDate(utctime), 'UT time of the meteo observation')
+                  ]
+        return Snapshot(utctime, values, UNITS, header, created, expires)
+
+    def _update(self, scrape):
         """
-        Updates with the LCOGT results
+        Updates with the LCOGT results, a dict site -> datums as returned by LCOGTScrapper.scrape.
         """
-        if all([v in value.keys() for v in
-                ['humidity', 'pressure', 'temperature', 'sky_transparency', 'dew_point',
-                 'wind_speed', 'wind_direction']]):
+        for site, value in scrape.iteritems():
+            if not all([v in value.keys() for v in self['datums'] or UNITS.keys()]):
+                continue
             if not value.has_key('Interlock Reason'):
                 value['Interlock Reason'] = ''
+            if 'temperature' in value:
+                stamp = value['temperature']['TimeStamp']
+            else:
+                stamp = max([datum['TimeStamp'] for datum in value.values() if isinstance(datum, dict)])
+            if not stamp:
+                # the datum failed on the first scrape, there is no sample time yet.
+                self.log.debug('No LCOGT timestamp for site %s yet.', site)
+                continue
+            value['utctime'] = datetime.datetime.strptime(stamp, '%Y/%m/%d %H:%M:%S')
+            snapshot = self._make_snapshot(value)
+            self._site_snapshots[site] = snapshot
+            self._site_checks[site] = snapshot.created
+            if site != self._site:
+                continue
+            self._swap(snapshot)
+            self._site_checks[site] = self._last_check
             self._results = value
-            self._results['utctime'] = datetime.datetime.strptime(value['temperature']['TimeStamp'], '%Y/%m/%d %H:%M:%S')
             # self.log.debug('Updated LCOGT data: ' + self._results.__str__())
 
-    def control(self):
+    def replay(self, value):
         """
-        Watches LCOGT for data
+        Processes a scrape recorded with the record_path option, see replay.Replayer.
         """
+        if 'temperature' in value:
+            # recorded before the sites option, from the first site.
+            value = {self._site: value}
+        self._update(value)
 
-        if self.__stop:
-            return True
-
+    def _poll(self):
+        """
+        Scrapes LCOGT once.
+        :return: Time to wait before the next scrape, in seconds.
+        """
+        from requests.exceptions import ConnectTimeout, ReadTimeout, ConnectionError
+        self._metrics.inc('cache_misses')
         try:
             value = self._scrapper.scrape()
         except ConnectTimeout:
             self.log.warn('Timeout connecting to the weather server.')
-            return True
+            return self._schedule.failed()
         except ReadTimeout:
             self.log.warn('Timeout reading the weather server.')
-            return True
+            return self._schedule.failed()
         except ConnectionError:
             self.log.warn('Connection error.')
-            return True
+            return self._schedule.failed()
+
+        if self._scrapper.failures == len(self._scrapper.requests):
+            self.log.warn('Every LCOGT datum failed.')
+            return self._schedule.failed()
 
         if value is None:
-            return True
+            self._metrics.inc('skipped_refreshes')
         else:
+            if self._recorder is not None:
+                self._recorder.record(self.__class__.__name__, value)
             self._update(value)
-            return True
+        # a site answering any of its datums is still current.
+        for site in set([site for site, key in self._scrapper.requests if (site, key) not in self._scrapper.failed]):
+            self._site_checks[site] = time.time()
+            if site == self._site:
+                self._touch()
+        if self._results is None:
+            return self._schedule.delay()
+        return self._schedule.observe(to_timestamp(self._results['utctime']) / 1e6)
 
+    def _value(self, snapshot, quantity, unit_out):
+        return WSValue(snapshot.obs_time, snapshot.value(quantity, unit_out), unit_out)
 
-    def humidity(self, unit_out=units.pct):
+    def humidity(self, unit_out=units.pct, site=None):
 
-        if self._results is None:
+        snapshot = self._current(site)
+        if snapshot is None:
             return False
 
         if unit_out not in self.__accepted_humidity_units__:
             raise OptionConversionException("Invalid humidity unit %s." % unit_out)
-        
-        return WSValue(self._results['utctime'],
-                       self._convert_units(self._results['humidity']['Value'], units.pct, unit_out),
-                       unit_out)
 
-    def temperature(self, unit_out=units.Celsius):
+        return self._value(snapshot, 'humidity', unit_out)
 
-        if self._results is None:
+    def temperature(self, unit_out=units.Celsius, site=None):
+
+        snapshot = self._current(site)
+        if snapshot is None:
             return False
 
         if unit_out not in self.__accepted_temperature_units__:
             raise OptionConversionException("Invalid temperature unit %s." % unit_out)
 
-        return WSValue(self._results['utctime'],
-                       self._convert_units(self._results['temperature']['Value'],
-                                           units.Celsius, unit_out),
-                       unit_out)
+        return self._value(snapshot, 'temperature', unit_out)
 
-    def wind_speed(self, unit_out=units.meter / units.second):
+    def wind_speed(self, unit_out=M_S, site=None):
 
-        if self._results is None:
+        snapshot = self._current(site)
+        if snapshot is None:
             return False
 
         if unit_out not in self.__accepted_speed_units__:
             raise OptionConversionException("Invalid speed unit %s." % unit_out)
 
-        return WSValue(self._results['utctime'],
-                       self._convert_units(self._results['wind_speed']['Value'],
-                                           (units.m / units.s), unit_out),
-                       unit_out)
+        return self._value(snapshot, 'wind_speed', unit_out)
 
-    def wind_direction(self, unit_out=units.degree):
+    def wind_direction(self, unit_out=units.degree, site=None):
 
-        if self._results is None:
+        snapshot = self._current(site)
+        if snapshot is None:
             return False
 
         if unit_out not in self.__accepted_direction_unit__:
             raise OptionConversionException("Invalid speed unit %s." % unit_out)
 
-        return WSValue(self._results['utctime'],
-                       self._convert_units(self._results['wind_direction']['Value'],
-                                           units.deg, unit_out),
-                       unit_out)
+        return self._value(snapshot, 'wind_direction', unit_out)
 
-    def dew_point(self, unit_out=units.Celsius):
+    def dew_point(self, unit_out=units.Celsius, site=None):
         """
         :param unit_out:
         :return:
         """
 
-        if self._results is None:
+        snapshot = self._current(site)
+        if snapshot is None:
             return False
 
         if unit_out not in self.__accepted_temperature_units__:
             raise OptionConversionException("Invalid dew point unit %s." % unit_out)
 
-        return WSValue(self._results['utctime'],
-                       self._convert_units(self._results['dew_point']['Value'],
-                                           units.Celsius, unit_out),
-                       unit_out)
+        return self._value(snapshot, 'dew_point', unit_out)
 
-    def pressure(self, unit_out=units.Pa):
+    def pressure(self, unit_out=units.Pa, site=None):
 
-        if self._results is None:
+        snapshot = self._current(site)
+        if snapshot is None:
             return False
 
         if unit_out not in self.__accepted_pressures_unit__:
             raise OptionConversionException("Invalid pressure unit %s." % unit_out)
 
-        return WSValue(self._results['utctime'],
-                       self._convert_units(self._results['pressure']['Value'],
-                                           units.cds.mmHg, unit_out),
-                       unit_out)
+        return self._value(snapshot, 'pressure', unit_out)
 
-    def sky_transparency(self, unit_out=units.pct):
+    def sky_transparency(self, unit_out=units.pct, site=None):
 
-        if self._results is None:
+        snapshot = self._current(site)
+        if snapshot is None:
             return False
 
         if unit_out not in self.__accepted_transparency_unit__:
             raise OptionConversionException("Invalid sky transparency unit %s." % unit_out)
 
-        return WSValue(self._results['utctime'],
-                       self._convert_units(self._results['sky_transparency']['Value'],
-                                           units.pct, unit_out),
-                       unit_out)
+        return self._value(snapshot, 'sky_transparency', unit_out)
 
-    def getMetadata(self, request):
+    def wind_gust(self, unit_out=M_S, window=None):
+        '''
+        Returns the maximum wind speed over window seconds, one of stats_windows. Defaults to the shortest one.
+        '''
 
-        try:
-            return [('ENVMOD', str(self['model']), 'Weather station Model'),
-                    ('ENVTEM', self.temperature(unit_out=units.deg_C).value, '[degC] Weather station temperature'),
-                    ('ENVDEW', self.dew_point(unit_out=units.deg_C).value, '[degC] Weather station dew point temperature'),
-                    ('ENVHUM', self.humidity(unit_out=units.pct).value, '[%] Weather station relative humidity'),
-                    ('ENVWIN', self.wind_speed(unit_out=units.m / units.s).value, '[m/s] Weather station wind speed'),
-                    ('ENVDIR', self.wind_direction(unit_out=units.deg).value, '[deg] Weather station wind direction'),
-                    ('ENVPRE', self.pressure(unit_out=units.cds.mmHg).value, '[mmHg] Weather station air pressure'),
-                    ('ENVDAT', ImageUtil.formatDate(self._results['utctime']), 'UT time of the meteo observation')
-                    ]
-        except AttributeError:
-            return []
+        if unit_out not in self.__accepted_speed_units__:
+            raise OptionConversionException("Invalid speed unit %s." % unit_out)
+
+        stats = self._rolling('wind_speed', window)
+        if stats is None:
+            return False
+        return WSValue(datetime.datetime.utcfromtimestamp(stats['until'] / 1e6),
+                       conversion.convert(stats['max'], M_S, unit_out), unit_out)
 
 
 if __name__ == '__main__':
     test = LCOGTWeather()
     time.sleep(10)
     test.__start__()
-    test.control()
+    test._poll()
     print test.getMetadata(None)
@@ -1,71 +1,186 @@
-import time
 import datetime
-import threading
+import logging
+import time
 
-import xmltodict as xmltodict
 from astropy import units
 from chimera.core.exceptions import OptionConversionException
 from chimera.instruments.weatherstation import WeatherBase
 from chimera.interfaces.weatherstation import WeatherTransparency, WSValue
-import requests
+from chimera.util.image import ImageUtil
+
+from chimera_ctioenviroment import rasicamxml
+from chimera_ctioenviroment.poller import get_poller
+from chimera_ctioenviroment.polling import ConditionalFetcher
+from chimera_ctioenviroment.snapshot import Snapshot
+from chimera_ctioenviroment.source import SnapshotSource
+from chimera_ctioenviroment.thresholds import ReadingEvents, ChangeDetector
+
+# units of the Snapshot values, the same used on the FITS headers.
+UNITS = dict(transparency=units.pct)
 
+# cards aligned to the exposure by getMetadata.
+KEYWORDS = dict(TRAVAL='transparency')
+# TRAVAL is a clear (100) / not clear (0) flag, never interpolated.
+STEPS = ('TRAVAL',)
 
-class Rasicam(WeatherBase, WeatherTransparency):
+
+class Rasicam(SnapshotSource, WeatherBase, WeatherTransparency, ReadingEvents):
     """
     Instrument that gets information from RASICAM web page
     """
 
 
-    __config__ = dict(model="RASICAM all sky camera")
+    __config__ = dict(model="RASICAM all sky camera",
+                      url="http://rasicam.ctio.noao.edu/RASICAMWebService/vi/",
+                      poll_interval=30.,  # in seconds. used when adaptive_schedule is off
+                      adaptive_schedule=True,  # learn the update period of RASICAM and poll right after each update
+                      min_poll_interval=5.,  # in seconds
+                      max_poll_interval=120.,  # in seconds
+                      timeout=10.,  # in seconds
+                      max_backoff=300.,  # in seconds
+                      max_staleness=10 * 60,  # snapshots checked longer ago are never served. in seconds
+                      debug_sample=100,  # dump one out of debug_sample payloads on debug level
+                      history_size=4096,  # readings kept in memory
+                      cache_path="~/.chimera/rasicam-{source}.sqlite",  # kept across restarts. empty to disable
+                      cache_max_age=15 * 60,  # maximum age of a cached reading to be served. in seconds
+                      exposure_aligned=True,  # header values at the middle of the exposure, from the history
+                      long_exposure=60,  # exposures at least this long get min/max/mean cards. in seconds
+                      transparency_deadband=50.,  # readingChanged when the transparency flips. in %
+                      shared_feed="",  # "publish" the readings on shared_feed_path or "read" them from there
+                      shared_feed_path="/dev/shm/chimera-rasicam",
+                      record_path="",  # append the payloads to this compressed log. empty to disable
+                      replay=False,  # fed by a replay.Replayer instead of RASICAM
+                      archive_path="",  # long term columnar archive directory, see archive.Archive. empty to disable
+                      archive_interval=10 * 60,  # in seconds
+                      )
+
+    _units = UNITS
+    _keywords = KEYWORDS
+    _steps = STEPS
+    _source_options = ('url',)
+    _date_keyword = 'TRADAT'
+
+    def __init__(self):
+        WeatherBase.__init__(self)
+        SnapshotSource.__init__(self)
+        self._results = None
+        self._fetcher = None
+        self._parsed = 0
+        self._last_sample_time = None
+        # the latest payload fetched was not a reading, e.g. Error Updating Status.
+        self._rejected = False
 
     def __start__(self):
         """
-        Start a thread that will be querying the rasicam forever and ever...
+        Schedule the RASICAM polls on the poller shared by every HTTP source.
         """
-        self.__stop = False
-        self._results = None
-        p = threading.Thread(target=self._watch)
-        p.start()
-
-    def __stop__(self):
-        self.__stop = True
+        self._changes = ChangeDetector(deadbands=dict(transparency=self['transparency_deadband']))
+        if not self._open() or self['replay']:
+            return
+        poller = get_poller()
+        self._fetcher = ConditionalFetcher(self['url'], timeout=self['timeout'], session=poller.session,
+                                           metrics=self._metrics)
+        self._metrics.gauge('poll_rate', self._fetcher.stats.rate)
+        self._metrics.gauge('wasted_polls', lambda: self._fetcher.stats.wasted)
+        self._schedule = self._adaptive_schedule('poll_interval', 'min_poll_interval', 'max_poll_interval')
+        self._job = poller.schedule(self._poll, name='Rasicam')
 
     def _update(self, data):
         """
         Updates with the RASICAM results
         """
-        self._results = dict(stdev=data['StDev'],
-                             transparency=100. * (
-                                 float(data['StDev']['GlobalStDev']) <= float(data['StDev']['StDevThresh'])),
+        stdev = dict(GlobalStDev=data['GlobalStDev'], StDevThresh=data['StDevThresh'])
+        self._results = dict(stdev=stdev,
+                             transparency=100. * (float(stdev['GlobalStDev']) <= float(stdev['StDevThresh'])),
                              last_update=datetime.datetime.utcnow())
-        self.log.debug('Updated RASICAM data: ' + self._results.__str__())
+        self._swap(self._make_snapshot(self._results))
+        self.log.debug('Updated RASICAM data: %s', self._results)
+
+    def _make_snapshot(self, results):
+        return self._build_snapshot(results['last_update'], dict(transparency=results['transparency']))
+
+    def _build_snapshot(self, last_update, values, created=None, expires=None):
+        header = [('TRAMOD', str(self['model']), 'Sky transparency monitor Model'),
+                  ('TRAVAL', values['transparency'], '[%] Sky transparency'),
+                  ('TRADAT', ImageUtil.formatDate(last_update), 'UT time of the transparency observation')
+                  ]
+        return Snapshot(last_update, values, UNITS, header, created, expires)
+
+    def _poll(self):
+        """
+        Polls RASICAM once.
+        :return: Time to wait before the next poll, in seconds.
+        """
+        from requests.exceptions import RequestException
+        self._metrics.inc('cache_misses')
+        try:
+            body = self._fetcher.fetch()
+        except RequestException, e:
+            delay = self._schedule.failed()
+            self.log.debug('Error connecting RASICAM: %s. Sleeping %.1f seconds before trying again.' % (e, delay))
+            return delay
+
+        if body is None:
+            self._metrics.inc('skipped_refreshes')
+            if self._rejected:
+                return self._schedule.failed()
+            # RASICAM answered with the payload already seen: the snapshot is still current.
+            self._touch()
+            if self._last_sample_time is None:
+                return self._schedule.delay()
+            return self._schedule.observe(self._last_sample_time)
+        if self._recorder is not None:
+            self._recorder.record(self.__class__.__name__, body)
+        self._rejected = not self._parse(body)
+        if self._rejected:
+            return self._schedule.failed()
+        return self._schedule.observe(self._last_sample_time)
+
+    def replay(self, body):
+        """
+        Processes a payload recorded with the record_path option, see replay.Replayer.
+        """
+        self._parse(body)
+
+    def _parse(self, body):
+        """
+        Updates with a RASICAM payload.
+        :return: True if the payload carried a new reading, False if it was rejected.
+        """
+        self._parsed += 1
+        if self.log.isEnabledFor(logging.DEBUG) and (self._parsed - 1) % self['debug_sample'] == 0:
+            self.log.debug('RASICAM.text >>> %s', body)
+
+        if 'Error Updating Status' in body:
+            self.log.debug('Skipping Error Updating Status...')
+            return False
+
+        try:
+            with self._metrics.timer('parse_seconds'):
+                data = rasicamxml.extract(body)
+        except rasicamxml.ParseError, e:
+            self._metrics.error(e)
+            self.log.debug('Invalid RASICAM data: %s', e)
+            return False
+
+        if data is None:
+            self.log.debug('Data is not Chart.')
+            return False
+        if data.get('ResponseType') != 'Chart' or 'GlobalStDev' not in data or 'StDevThresh' not in data:
+            return False
+        # RASICAM payloads carry no timestamp, the arrival of a new one is the sample time.
+        self._last_sample_time = time.time()
+        self._update(data)
+        return True
 
-    def _watch(self):
+    def poll_stats(self):
         """
-        Watches RASICAM for data
+        Returns the RASICAM polling counters: polls, not_modified, unchanged, errors, wasted and rate (polls/s), or
+        None if this instance does not poll RASICAM (shared_feed read, replay or not started).
         """
-        while 1:
-
-            if self.__stop:
-                return
-            try:
-                data = requests.get('http://rasicam.ctio.noao.edu/RASICAMWebService/vi/')
-            except ConnectionError:
-                self.log.debug('Error connecting RASICAM. Sleeping 10 seconds before trying again.')
-                time.sleep(10)
-
-            self.log.debug('RASICAM.text >>>' + data.text)
-            if not 'Error Updating Status' in data.text:
-                aux_dict = xmltodict.parse(data.text)
-                if 'ChartData' in aux_dict.keys():
-                    aux_dict = aux_dict['ChartData']
-                    self.log.debug('RASICAM.dict >>' + aux_dict.__str__())
-                    if aux_dict['ResponseType'] == 'Chart' and 'StDev' in aux_dict:
-                        self._update(aux_dict)
-                else:
-                    self.log.debug('Data is not Chart:' + aux_dict.__str__())
-            else:
-                self.log.debug('Skipping Error Updating Status...')
+        if self._fetcher is None:
+            return None
+        return self._fetcher.stats.as_dict()
 
     def sky_transparency(self, unit_out=units.pct):
         """
@@ -75,7 +190,8 @@ class Rasicam(WeatherBase, WeatherTransparency):
         if unit_out not in self.__accepted_transparency_unit__:
             raise OptionConversionException("Invalid transparency unit %s." % unit_out)
 
-        if self._results is not None:
-            return WSValue(self._results['last_update'], self._results['transparency'], unit_out)
+        snapshot = self._current()
+        if snapshot is not None:
+            return WSValue(snapshot.obs_time, snapshot.value('transparency', unit_out), unit_out)
         else:
             return False
@@ -0,0 +1,238 @@
+import datetime
+import logging
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from astropy import units
+from chimera.core.exceptions import OptionConversionException
+from chimera.instruments.weatherstation import WeatherBase
+from chimera.interfaces.weatherstation import WeatherTemperature, WeatherHumidity, WeatherPressure, WeatherWind, \
+    WeatherTransparency
+
+from chimera_ctioenviroment.metrics import Metrics
+
+# interface of each accessor; sources not implementing it are not asked. getMetadata is asked to every source.
+INTERFACES = dict(temperature=WeatherTemperature, dew_point=WeatherTemperature, humidity=WeatherHumidity,
+                  pressure=WeatherPressure, wind_speed=WeatherWind, wind_direction=WeatherWind,
+                  sky_transparency=WeatherTransparency)
+
+
+def card_time(cards):
+    '''
+    :param cards: FITS header cards of one instrument.
+    :return: UT datetime of its *DAT card or None.
+    '''
+    for keyword, value, comment in cards:
+        if keyword.endswith('DAT') and isinstance(value, basestring):
+            try:
+                return datetime.datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+            except ValueError:
+                return None
+    return None
+
+
+class SiteWeather(WeatherBase, WeatherTemperature, WeatherHumidity, WeatherPressure, WeatherWind,
+                  WeatherTransparency):
+    """
+    Site environment merged from several weather instruments, e.g. CTIOWeather, LCOGTWeather and Rasicam.
+
+    Every source implementing the accessor (see INTERFACES and ChimeraObject.features) is queried at the same time
+    and each quantity is taken from the source with the freshest valid reading; sources listed first win ties.
+    Sources which do not answer before the deadline are left out, and are not queried again until their late answer
+    arrives.
+    """
+
+    __config__ = dict(model="CTIO site environment",
+                      sources=["/CTIOWeather/0", "/LCOGTWeather/0", "/Rasicam/0"],  # in priority order
+                      deadline=1.,  # maximum time waiting for the sources. in seconds
+                      max_age=15 * 60,  # readings older than this are ignored. in seconds
+                      )
+
+    def __init__(self):
+        WeatherBase.__init__(self)
+
+        self._pool = None
+        self._proxies = threading.local()
+        # location -> AsyncResult of a call which missed the deadline.
+        self._late = dict()
+        # (location, interface) -> whether the source implements the interface.
+        self._features = dict()
+        self._metrics = Metrics()
+        self._metrics.gauge('late_sources', lambda: len([r for r in self._late.values() if not r.ready()]))
+
+        # logging.
+        # put every logger on behalf of chimera's logger so
+        # we can easily setup levels on all our parts
+        logName = self.__module__
+        if not logName.startswith("chimera."):
+            logName = "chimera." + logName + " (%s)" % logName
+
+        self.log = logging.getLogger(logName)
+
+    def __start__(self):
+        self._pool = ThreadPool(2 * len(self['sources']))
+
+    def __stop__(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def _proxy(self, location):
+        # proxies are not shared among threads.
+        proxies = self._proxies.__dict__
+        if location not in proxies:
+            proxies[location] = self.getManager().getProxy(location)
+        return proxies[location]
+
+    def _call(self, location, method, args):
+        with self._metrics.timer('source_seconds'):
+            return getattr(self._proxy(location), method)(*args)
+
+    def _sources(self, method):
+        '''
+        :return: list of (priority, location) of the sources implementing method. Each source is asked once per
+                 interface, sources which do not answer are kept and asked again on the next call.
+        '''
+        interface = INTERFACES.get(method)
+        if interface is None:
+            return list(enumerate(self['sources']))
+        pending = [(location, self._pool.apply_async(self._call, (location, 'features', (interface,))))
+                   for location in self['sources'] if (location, interface) not in self._features]
+        deadline = time.time() + self['deadline']
+        for location, result in pending:
+            try:
+                self._features[location, interface] = bool(result.get(max(0., deadline - time.time())))
+            except Exception, e:
+                self._metrics.error(e)
+                self.log.debug('%s.features failed: %s' % (location, e.__class__.__name__))
+        return [(priority, location) for priority, location in enumerate(self['sources'])
+                if self._features.get((location, interface), True)]
+
+    def _gather(self, method, *args):
+        '''
+        Calls method on every source implementing it at once.
+        :return: list of (priority, result) of the sources which answered before the deadline.
+        '''
+        pending = []
+        for priority, location in self._sources(method):
+            late = self._late.get(location)
+            if late is not None:
+                if not late.ready():
+                    self._metrics.inc('skipped_sources')
+                    continue
+                self._late.pop(location, None)
+            pending.append((priority, location, self._pool.apply_async(self._call, (location, method, args))))
+
+        deadline = time.time() + self['deadline']
+        results = []
+        for priority, location, result in pending:
+            try:
+                results.append((priority, result.get(max(0., deadline - time.time()))))
+            except Exception, e:
+                self._metrics.error(e)
+                if not result.ready():
+                    self._late[location] = result
+                self.log.debug('%s.%s failed: %s' % (location, method, e.__class__.__name__))
+        return results
+
+    def _oldest(self):
+        return datetime.datetime.utcnow() - datetime.timedelta(seconds=self['max_age'])
+
+    def _value(self, quantity, unit_out):
+        '''
+        :return: the freshest valid WSValue of quantity among the sources or False.
+        '''
+        oldest = self._oldest()
+        best = None
+        for priority, value in self._gather(quantity, unit_out):
+            if not value or value.value is None or value.time is None or value.time < oldest:
+                continue
+            if best is None or value.time > best[1].time or (value.time == best[1].time and priority < best[0]):
+                best = priority, value
+        if best is None:
+            return False
+        return best[1]
+
+    def humidity(self, unit_out=units.pct):
+
+        if unit_out not in self.__accepted_humidity_units__:
+            raise OptionConversionException("Invalid humidity unit %s." % unit_out)
+
+        return self._value('humidity', unit_out)
+
+    def temperature(self, unit_out=units.Celsius):
+
+        if unit_out not in self.__accepted_temperature_units__:
+            raise OptionConversionException("Invalid temperature unit %s." % unit_out)
+
+        return self._value('temperature', unit_out)
+
+    def wind_speed(self, unit_out=units.meter / units.second):
+
+        if unit_out not in self.__accepted_speed_units__:
+            raise OptionConversionException("Invalid speed unit %s." % unit_out)
+
+        return self._value('wind_speed', unit_out)
+
+    def wind_direction(self, unit_out=units.degree):
+
+        if unit_out not in self.__accepted_direction_unit__:
+            raise OptionConversionException("Invalid direction unit %s." % unit_out)
+
+        return self._value('wind_direction', unit_out)
+
+    def dew_point(self, unit_out=units.Celsius):
+
+        if unit_out not in self.__accepted_temperature_units__:
+            raise OptionConversionException("Invalid dew point unit %s." % unit_out)
+
+        return self._value('dew_point', unit_out)
+
+    def pressure(self, unit_out=units.Pa):
+
+        if unit_out not in self.__accepted_pressures_unit__:
+            raise OptionConversionException("Invalid pressure unit %s." % unit_out)
+
+        return self._value('pressure', unit_out)
+
+    def sky_transparency(self, unit_out=units.pct):
+
+        if unit_out not in self.__accepted_transparency_unit__:
+            raise OptionConversionException("Invalid sky transparency unit %s." % unit_out)
+
+        return self._value('sky_transparency', unit_out)
+
+    def metrics(self):
+        """
+        Returns the source latency histogram, the error counters and the number of late sources.
+        """
+        return self._metrics.as_dict()
+
+    def metrics_text(self):
+        """
+        Returns metrics() in the Prometheus text format.
+        """
+        return self._metrics.prometheus('ctioenv_', instrument=self.__class__.__name__)
+
+    def getMetadata(self, request):
+        '''
+        Merges the headers of every source, taking each keyword from the source with the freshest valid readings.
+        '''
+        oldest = self._oldest()
+        chosen = dict()
+        order = []
+        for priority, cards in sorted(self._gather('getMetadata', request)):
+            obs_time = card_time(cards)
+            if obs_time is not None and obs_time < oldest:
+                continue
+            for card in cards:
+                keyword, value = card[0], card[1]
+                if value is None:
+                    continue
+                if keyword not in chosen:
+                    order.append(keyword)
+                elif obs_time is None or (chosen[keyword][0] is not None and obs_time <= chosen[keyword][0]):
+                    continue
+                chosen[keyword] = obs_time, card
+        return [chosen[keyword][1] for keyword in order]
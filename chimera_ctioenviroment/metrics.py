@@ -0,0 +1,137 @@
+import bisect
+import contextlib
+import threading
+import time
+
+# upper bounds of the latency histograms, in seconds.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30.)
+
+
+class Histogram(object):
+    """
+    Latency histogram with fixed buckets.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self):
+        cumulative = []
+        total = 0
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return dict(count=self.count, sum=self.sum,
+                    buckets=zip([str(b) for b in self.buckets] + ['+Inf'], cumulative))
+
+
+class Metrics(object):
+    """
+    Latency histograms, counters and gauges of one instrument or data source.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = dict()
+        self._counters = dict()
+        self._gauges = dict()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram()
+            self._histograms[name].observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        '''
+        Observes on histogram name the time spent on the with block.
+        '''
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - t0)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def error(self, exception):
+        '''
+        Counts exception on the errors counter, labeled by its class.
+        '''
+        self.inc('errors', exception=exception.__class__.__name__)
+
+    def gauge(self, name, function):
+        '''
+        Registers a gauge whose value is function(), evaluated when the metrics are read.
+        '''
+        with self._lock:
+            self._gauges[name] = function
+
+    def as_dict(self):
+        with self._lock:
+            histograms = dict([(name, h.as_dict()) for name, h in self._histograms.items()])
+            counters = self._counters.items()
+            gauges = self._gauges.items()
+
+        metrics = dict(histograms)
+        for (name, labels), value in counters:
+            if labels:
+                metrics.setdefault(name, dict())[','.join(['%s=%s' % label for label in labels])] = value
+            else:
+                metrics[name] = value
+        for name, function in gauges:
+            try:
+                metrics[name] = function()
+            except Exception:
+                metrics[name] = None
+        return metrics
+
+    def prometheus(self, prefix, **labels):
+        '''
+        :return: the metrics in the Prometheus text exposition format.
+        '''
+        def fmt(extra=()):
+            items = sorted(labels.items()) + list(extra)
+            if not items:
+                return ''
+            return '{%s}' % ','.join(['%s="%s"' % item for item in items])
+
+        with self._lock:
+            histograms = [(name, h.as_dict()) for name, h in sorted(self._histograms.items())]
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+
+        lines = []
+        for name, h in histograms:
+            lines.append('# TYPE %s%s histogram' % (prefix, name))
+            for bound, count in h['buckets']:
+                lines.append('%s%s_bucket%s %d' % (prefix, name, fmt([('le', bound)]), count))
+            lines.append('%s%s_sum%s %r' % (prefix, name, fmt(), h['sum']))
+            lines.append('%s%s_count%s %d' % (prefix, name, fmt(), h['count']))
+        typed = set()
+        for (name, extra), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE %s%s_total counter' % (prefix, name))
+            lines.append('%s%s_total%s %d' % (prefix, name, fmt(extra), value))
+        for name, function in gauges:
+            try:
+                value = function()
+            except Exception:
+                value = None
+            if value is not None:
+                lines.append('# TYPE %s%s gauge' % (prefix, name))
+                lines.append('%s%s%s %r' % (prefix, name, fmt(), float(value)))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,129 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+log = logging.getLogger("chimera." + __name__)
+
+
+class Job(object):
+    """
+    Periodic call registered on a Poller.
+    """
+
+    def __init__(self, poller, function, name):
+        self.poller = poller
+        self.function = function
+        self.name = name
+        self.cancelled = False
+
+    def cancel(self):
+        '''
+        Stops rescheduling the job. A run already in progress finishes, but is not followed by another one.
+        '''
+        self.poller.cancel(self)
+
+
+class Poller(object):
+    """
+    Runs the polls of every HTTP source of the process on one timer thread and a bounded pool of workers, over a
+    single requests.Session.
+
+    Jobs are functions returning the time to wait before their next run, in seconds. A job never runs twice at the
+    same time, so it needs no locking of its own.
+    """
+
+    def __init__(self, workers=4, fetchers=8):
+        '''
+        :param workers: threads running the jobs.
+        :param fetchers: threads of pool, for jobs fanning out several requests at once.
+        '''
+        self.workers = workers
+        self.fetchers = fetchers
+        # requests is loaded by the first HTTP instrument started, not when the plugin is imported.
+        import requests.adapters
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=workers + fetchers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._cond = threading.Condition()
+        self._queue = []
+        self._counter = itertools.count()
+        self._jobs = set()
+        self._thread = None
+        self._workers = None
+        self._pool = None
+
+    @property
+    def pool(self):
+        '''
+        ThreadPool for the requests fanned out by the jobs.
+        '''
+        with self._cond:
+            if self._pool is None:
+                self._pool = ThreadPool(self.fetchers)
+            return self._pool
+
+    def schedule(self, function, delay=0., name=None):
+        '''
+        Registers function to be run after delay seconds and then again after every delay it returns.
+        :return: Job.
+        '''
+        job = Job(self, function, name or getattr(function, '__name__', 'job'))
+        with self._cond:
+            if self._thread is None:
+                self._workers = ThreadPool(self.workers)
+                self._thread = threading.Thread(target=self._run, name='Poller')
+                self._thread.daemon = True
+                self._thread.start()
+            self._jobs.add(job)
+            self._push(job, delay)
+        return job
+
+    def cancel(self, job):
+        with self._cond:
+            job.cancelled = True
+            self._jobs.discard(job)
+            self._cond.notify()
+
+    def _push(self, job, delay):
+        heapq.heappush(self._queue, (time.time() + delay, next(self._counter), job))
+        self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue or self._queue[0][0] > time.time():
+                    self._cond.wait(self._queue[0][0] - time.time() if self._queue else None)
+                due, n, job = heapq.heappop(self._queue)
+                if job.cancelled:
+                    continue
+            self._workers.apply_async(self._call, (job,))
+
+    def _call(self, job):
+        delay = None
+        try:
+            delay = job.function()
+        except Exception, e:
+            log.exception('Error running %s: %s' % (job.name, e))
+        with self._cond:
+            if not job.cancelled:
+                # a failing job is retried after a minute.
+                self._push(job, 60. if delay is None else delay)
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_poller():
+    '''
+    Returns the process wide Poller.
+    '''
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = Poller()
+        return _poller
@@ -0,0 +1,219 @@
+import collections
+import hashlib
+import random
+import time
+
+from chimera_ctioenviroment.metrics import Metrics
+
+
+class PollStats(object):
+    """
+    Counters of an HTTP polling loop.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.polls = 0
+        self.not_modified = 0
+        self.unchanged = 0
+        self.errors = 0
+
+    @property
+    def wasted(self):
+        '''
+        Polls which did not bring any new data.
+        '''
+        return self.not_modified + self.unchanged + self.errors
+
+    def rate(self):
+        '''
+        :return: Polls per second since the poller was created.
+        '''
+        elapsed = time.time() - self.started
+        if elapsed <= 0:
+            return 0.
+        return self.polls / elapsed
+
+    def as_dict(self):
+        return dict(polls=self.polls, not_modified=self.not_modified, unchanged=self.unchanged, errors=self.errors,
+                    wasted=self.wasted, rate=self.rate())
+
+
+class ConditionalFetcher(object):
+    """
+    Fetches an URL with If-None-Match/If-Modified-Since and only returns bodies which actually changed.
+    """
+
+    def __init__(self, url, timeout=10., session=None, metrics=None):
+        self.url = url
+        self.metrics = metrics or Metrics()
+        self.timeout = timeout
+        self.stats = PollStats()
+        if session is None:
+            import requests
+            session = requests.Session()
+        self._session = session
+        self._etag = None
+        self._last_modified = None
+        self._digest = None
+
+    def fetch(self):
+        '''
+        :return: Response body if it changed since the last fetch, None otherwise.
+        Raises requests.exceptions.RequestException on errors.
+        '''
+        headers = dict()
+        if self._etag is not None:
+            headers['If-None-Match'] = self._etag
+        if self._last_modified is not None:
+            headers['If-Modified-Since'] = self._last_modified
+
+        import requests
+        self.stats.polls += 1
+        try:
+            with self.metrics.timer('http_seconds'):
+                response = self._session.get(self.url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304:
+                self.stats.not_modified += 1
+                return None
+            response.raise_for_status()
+        except requests.exceptions.RequestException, e:
+            self.stats.errors += 1
+            self.metrics.error(e)
+            raise
+
+        self._etag = response.headers.get('ETag')
+        self._last_modified = response.headers.get('Last-Modified')
+
+        digest = hashlib.sha1(response.content).digest()
+        if digest == self._digest:
+            self.stats.unchanged += 1
+            return None
+        self._digest = digest
+        return response.content
+
+
+class Backoff(object):
+    """
+    Exponential backoff with jitter.
+    """
+
+    def __init__(self, base, maximum, factor=2.):
+        self.base = base
+        self.maximum = maximum
+        self.factor = factor
+        self.failures = 0
+
+    def next(self):
+        '''
+        Registers a failure.
+        :return: Time to wait before the next attempt, in seconds.
+        '''
+        delay = min(self.maximum, self.base * self.factor ** self.failures)
+        self.failures += 1
+        return random.uniform(delay / 2., delay)
+
+    def reset(self):
+        self.failures = 0
+
+
+class AdaptiveSchedule(object):
+    """
+    Learns the publish period of a source from the timestamps of its samples and schedules the next poll just
+    after the next sample is expected, backing off while the source is down.
+
+    Until the period is known the source is polled every minimum seconds, so the first intervals seen are not
+    multiples of the real period. The period is the median of the last intervals. Once confirm of them agree on it,
+    an interval of several periods is taken as samples missed between two polls. When reset_misses polls in a row
+    bring no new sample the source changed its cadence, or paused, and the period is learned again.
+    """
+
+    def __init__(self, minimum, maximum, max_backoff=None, margin=0.1, window=8, confirm=3, reset_misses=3):
+        '''
+        :param minimum: minimum delay between polls, in seconds.
+        :param maximum: maximum delay between polls while the source answers, in seconds.
+        :param max_backoff: maximum delay between polls while the source fails, in seconds. Defaults to maximum.
+        :param margin: fraction of the period waited after the expected sample time. Intervals within this fraction
+                       of the period agree with it.
+        :param window: number of intervals between samples the period is estimated from.
+        :param confirm: number of intervals agreeing on the period before longer ones count as several periods.
+        :param reset_misses: polls in a row without a new sample after which the period is learned again.
+        '''
+        self.minimum = minimum
+        self.maximum = maximum
+        self.margin = margin
+        self.confirm = confirm
+        self.reset_misses = reset_misses
+        self.period = None
+        self.misses = 0
+        self._last_sample = None
+        # raw intervals between the samples seen and the period confirmed by them, if any.
+        self._intervals = collections.deque(maxlen=window)
+        self._confirmed = None
+        self._lags = collections.deque(maxlen=window)
+        self._backoff = Backoff(minimum, max(minimum, max_backoff or maximum))
+
+    def observe(self, sample_time, now=None):
+        '''
+        Registers a successful poll.
+        :param sample_time: time of the newest sample served by the source, in seconds since the epoch.
+        :return: Time to wait before the next poll, in seconds.
+        '''
+        now = time.time() if now is None else now
+        self._backoff.reset()
+        if self._last_sample is None or sample_time > self._last_sample:
+            if self.period is not None and self.misses >= self.reset_misses:
+                # the interval spans the change, it belongs to neither cadence.
+                self._intervals.clear()
+                self._confirmed = None
+                self.period = None
+            elif self._last_sample is not None:
+                self._intervals.append(sample_time - self._last_sample)
+                self.period = self._estimate()
+            # publishing latency plus clock offset; the smallest one is the closest to the real one.
+            self._lags.append(now - sample_time)
+            self._last_sample = sample_time
+            self.misses = 0
+        else:
+            self.misses += 1
+        return self.delay(now)
+
+    def _agrees(self, interval, period):
+        return abs(interval - period) <= self.margin * period
+
+    def _estimate(self):
+        '''
+        :return: median of the intervals, the ones of several confirmed periods split in single periods.
+        '''
+        intervals = [float(interval) for interval in self._intervals]
+        if self._confirmed is not None:
+            for i, interval in enumerate(intervals):
+                # samples published between two polls are never seen.
+                n = int(round(interval / self._confirmed))
+                if n > 1 and self._agrees(interval / n, self._confirmed):
+                    intervals[i] = interval / n
+        period = sorted(intervals)[len(intervals) // 2]
+        if len([interval for interval in intervals if self._agrees(interval, period)]) >= self.confirm:
+            self._confirmed = period
+        return period
+
+    def failed(self):
+        '''
+        Registers a failed poll.
+        :return: Time to wait before the next poll, in seconds.
+        '''
+        return self._backoff.next()
+
+    def delay(self, now=None):
+        '''
+        :return: Time to wait before the next poll, in seconds.
+        '''
+        if self.period is None:
+            return self.minimum
+        now = time.time() if now is None else now
+        expected = self._last_sample + min(self._lags) + self.period * (1 + self.margin)
+        delay = expected - now
+        if self.misses:
+            # the sample is late: poll again after a growing fraction of the period.
+            delay = max(delay, self.period * self.margin * 2 ** self.misses)
+        return min(self.maximum, max(self.minimum, delay))
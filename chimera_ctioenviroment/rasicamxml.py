@@ -0,0 +1,40 @@
+import io
+
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+
+# cElementTree raises its own ParseError, not xml.etree.ElementTree.ParseError.
+ParseError = ElementTree.ParseError
+
+FIELDS = ('ResponseType', 'GlobalStDev', 'StDevThresh')
+
+
+def extract(body, fields=FIELDS):
+    '''
+    Incrementally parses a RASICAM ChartData document, stopping as soon as all the wanted fields were seen.
+    :param body: Raw XML document.
+    :param fields: Tag names of the wanted fields.
+    :return: dict tag -> text of the fields found or None if the document is not a ChartData.
+    :raise ParseError: if body is not well formed XML.
+    '''
+    if isinstance(body, unicode):
+        body = body.encode('utf-8')
+
+    found = dict()
+    depth = 0
+    for event, elem in ElementTree.iterparse(io.BytesIO(body), events=('start', 'end')):
+        if event == 'start':
+            if depth == 0 and elem.tag != 'ChartData':
+                return None
+            depth += 1
+            continue
+        depth -= 1
+        if elem.tag in fields:
+            found[elem.tag] = elem.text
+            if len(found) == len(fields):
+                break
+        # keep memory flat on large documents: nothing else is looked at.
+        elem.clear()
+    return found
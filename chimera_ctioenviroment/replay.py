@@ -0,0 +1,127 @@
+import atexit
+import cPickle as pickle
+import gzip
+import os
+import threading
+import time
+
+
+class Recorder(object):
+    """
+    Appends the raw responses of the sources to a gzip compressed log of pickled (time, source, payload) records.
+
+    Records are flushed at most every flush_interval seconds, so a crash loses at most that much of the log. Every
+    Recorder appends a new gzip member to an existing log.
+    """
+
+    def __init__(self, path, flush_interval=60.):
+        path = os.path.expanduser(path)
+        if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.path = path
+        self.flush_interval = flush_interval
+        self._file = gzip.open(path, 'ab')
+        self._flushed = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, source, payload, t=None):
+        '''
+        :param source: name of the instrument class the payload is replayed into, e.g. CTIOWeather.
+        :param payload: raw response, as given to the replay method of the instrument.
+        :param t: time.time() of the response. Defaults to now.
+        '''
+        data = pickle.dumps((time.time() if t is None else t, source, payload), pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(data)
+            if time.time() - self._flushed > self.flush_interval:
+                self._file.flush()
+                self._flushed = time.time()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_recorders = dict()
+_recorders_lock = threading.Lock()
+
+
+def get_recorder(path):
+    '''
+    Returns the Recorder of path, shared by every instrument of the process recording on it.
+    '''
+    path = os.path.expanduser(path)
+    with _recorders_lock:
+        if path not in _recorders:
+            _recorders[path] = Recorder(path)
+        return _recorders[path]
+
+
+@atexit.register
+def _close_recorders():
+    with _recorders_lock:
+        for recorder in _recorders.values():
+            recorder.close()
+
+
+def read_log(path):
+    '''
+    Iterates over the records of a log written by Recorder. Logs are pickles: only replay logs you recorded.
+    :return: iterator over (time, source, payload), in recording order.
+    '''
+    log = gzip.open(os.path.expanduser(path), 'rb')
+    try:
+        while True:
+            try:
+                yield pickle.load(log)
+            except EOFError:
+                return
+            except (IOError, ValueError, pickle.UnpicklingError):
+                # log truncated by a crash while recording.
+                return
+    finally:
+        log.close()
+
+
+class Replayer(object):
+    """
+    Feeds a recorded log back into instruments started with the replay option, at real time or N times faster.
+    """
+
+    def __init__(self, path, speed=1.):
+        '''
+        :param speed: 1 for real time, N for N times faster, 0 for as fast as possible.
+        '''
+        self.path = path
+        self.speed = speed
+
+    def run(self, instruments, between=None):
+        '''
+        :param instruments: dict source -> instrument, e.g. {'CTIOWeather': weather}. Records of other sources
+                            are skipped.
+        :param between: function called with (time, source) after every record is replayed, e.g. to call the
+                        accessors of the instruments.
+        :return: number of records replayed.
+        '''
+        replayed = 0
+        start = time.time()
+        first = None
+        for t, source, payload in read_log(self.path):
+            instrument = instruments.get(source)
+            if instrument is None:
+                continue
+            if self.speed:
+                if first is None:
+                    first = t
+                wait = start + (t - first) / self.speed - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+            instrument.replay(payload)
+            replayed += 1
+            if between is not None:
+                between(t, source)
+        return replayed
@@ -0,0 +1,224 @@
+import collections
+import math
+import random
+import threading
+
+PERCENTILES = (10, 50, 90)
+
+_END = float('inf')
+
+
+class _Node(object):
+    __slots__ = ('value', 'next', 'width')
+
+    def __init__(self, value, levels):
+        self.value = value
+        self.next = [None] * levels
+        self.width = [1] * levels
+
+
+class IndexableSkiplist(object):
+    """
+    Sorted multiset of finite floats with O(log n) insertion, removal and access by rank.
+    """
+
+    def __init__(self, expected_size=4096):
+        self.size = 0
+        self.levels = int(1 + math.log(max(2, expected_size), 2))
+        self._end = _Node(_END, 0)
+        self._head = _Node(None, self.levels)
+        self._head.next = [self._end] * self.levels
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, rank):
+        if not 0 <= rank < self.size:
+            raise IndexError(rank)
+        node = self._head
+        rank += 1
+        for level in reversed(range(self.levels)):
+            while node.width[level] <= rank:
+                rank -= node.width[level]
+                node = node.next[level]
+        return node.value
+
+    def insert(self, value):
+        chain = [None] * self.levels
+        steps = [0] * self.levels
+        node = self._head
+        for level in reversed(range(self.levels)):
+            while node.next[level].value <= value:
+                steps[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        height = min(self.levels, 1 - int(math.log(1. - random.random(), 2.)))
+        new = _Node(value, height)
+        skipped = 0
+        for level in range(height):
+            previous = chain[level]
+            new.next[level] = previous.next[level]
+            previous.next[level] = new
+            new.width[level] = previous.width[level] - skipped
+            previous.width[level] = skipped + 1
+            skipped += steps[level]
+        for level in range(height, self.levels):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, value):
+        chain = [None] * self.levels
+        node = self._head
+        for level in reversed(range(self.levels)):
+            while node.next[level].value < value:
+                node = node.next[level]
+            chain[level] = node
+        found = chain[0].next[0]
+        if found.value != value:
+            raise KeyError(value)
+
+        for level in range(len(found.next)):
+            previous = chain[level]
+            previous.width[level] += found.width[level] - 1
+            previous.next[level] = found.next[level]
+        for level in range(len(found.next), self.levels):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+
+class RollingWindow(object):
+    """
+    Statistics of the samples of the last seconds seconds: count, mean, std, min, max (e.g. wind gusts), median and
+    percentiles.
+
+    Every append costs O(log n) and recomputes the statistics, so reading them is O(1) whatever the window length.
+    They are as of the latest sample: a window is only moved forward by new samples.
+    """
+
+    def __init__(self, seconds, percentiles=PERCENTILES, expected_size=4096):
+        '''
+        :param seconds: window length, in seconds.
+        :param percentiles: percentiles kept, as p<n> keys of stats.
+        :param expected_size: expected number of samples on the window.
+        '''
+        self.seconds = seconds
+        self.percentiles = percentiles
+        self.last = None
+        self.stats = None
+        self._span = int(seconds * 1e6)
+        self._samples = collections.deque()
+        self._sorted = IndexableSkiplist(expected_size)
+        # candidates for the maximum (decreasing values) and minimum (increasing values)
+        self._max = collections.deque()
+        self._min = collections.deque()
+        # sums are shifted by the first value, so the variance does not cancel out for values far from zero.
+        self._shift = None
+        self._sum = 0.
+        self._sum2 = 0.
+
+    def append(self, t, value):
+        '''
+        :param t: microseconds since the epoch. Samples not newer than the last one are ignored.
+        :param value: reading. NaN and infinite ones are ignored.
+        :return: True if the sample was appended.
+        '''
+        if (self.last is not None and t <= self.last) or math.isnan(value) or math.isinf(value):
+            return False
+        self.last = t
+        if self._shift is None:
+            self._shift = value
+
+        self._samples.append((t, value))
+        self._sorted.insert(value)
+        self._sum += value - self._shift
+        self._sum2 += (value - self._shift) ** 2
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((t, value))
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((t, value))
+
+        horizon = t - self._span
+        while self._samples[0][0] <= horizon:
+            old_t, old = self._samples.popleft()
+            self._sorted.remove(old)
+            self._sum -= old - self._shift
+            self._sum2 -= (old - self._shift) ** 2
+            if self._max[0][0] <= old_t:
+                self._max.popleft()
+            if self._min[0][0] <= old_t:
+                self._min.popleft()
+
+        self.stats = self._compute()
+        return True
+
+    def _percentile(self, p):
+        # linear interpolation between the closest ranks, like numpy.percentile.
+        position = (len(self._sorted) - 1) * p / 100.
+        lower = int(math.floor(position))
+        value = self._sorted[lower]
+        if position > lower:
+            value += (self._sorted[lower + 1] - value) * (position - lower)
+        return value
+
+    def _compute(self):
+        n = len(self._samples)
+        mean = self._sum / n
+        stats = dict(count=n,
+                     mean=mean + self._shift,
+                     std=math.sqrt(max(0., self._sum2 / n - mean ** 2)),
+                     min=self._min[0][1],
+                     max=self._max[0][1],
+                     median=self._percentile(50),
+                     since=self._samples[0][0],
+                     until=self.last)
+        for p in self.percentiles:
+            stats['p%d' % p] = self._percentile(p)
+        return stats
+
+
+class RollingStats(object):
+    """
+    RollingWindows of several quantities and window lengths, fed from a history.History.
+    """
+
+    def __init__(self, quantities, windows, expected_size=4096):
+        '''
+        :param quantities: names of the quantities.
+        :param windows: window lengths, in seconds.
+        :param expected_size: expected number of samples on each window.
+        '''
+        self.windows = sorted(windows)
+        self._windows = dict([((quantity, seconds), RollingWindow(seconds, expected_size=expected_size))
+                              for quantity in quantities for seconds in self.windows])
+        self._lock = threading.Lock()
+
+    def update(self, history):
+        '''
+        Appends the samples of history newer than the ones already seen.
+        '''
+        with self._lock:
+            for (quantity, seconds), window in self._windows.iteritems():
+                if window.last is None:
+                    t, v = history.query(quantity)
+                    if len(t):
+                        # older samples would be dropped right away.
+                        t, v = history.query(quantity, since=(t[-1] - int(seconds * 1e6)) / 1e6)
+                else:
+                    t, v = history.query(quantity, since=(window.last + 1) / 1e6)
+                for sample_t, value in zip(t.tolist(), v.tolist()):
+                    window.append(sample_t, value)
+
+    def get(self, quantity, window=None):
+        '''
+        :param window: window length, in seconds. Defaults to the shortest one.
+        :return: dict with the statistics, see RollingWindow, or None if there are no samples yet.
+        '''
+        seconds = self.windows[0] if window is None else window
+        try:
+            stats = self._windows[(quantity, seconds)].stats
+        except KeyError:
+            raise ValueError('No %s s window of %s. Windows: %s' % (seconds, quantity, self.windows))
+        return None if stats is None else dict(stats)
@@ -0,0 +1,50 @@
+import time
+
+from chimera_ctioenviroment import conversion
+
+
+class Snapshot(object):
+    """
+    Read-only set of readings of one refresh: values already converted to the header units, the FITS header
+    cards and the UT time of the observation. Instruments swap a new Snapshot in on every successful refresh,
+    so readers never need a lock.
+    """
+
+    __slots__ = ('obs_time', 'values', 'units', 'header', 'created', 'expires')
+
+    def __init__(self, obs_time, values, units, header, created=None, expires=None):
+        '''
+        :param obs_time: UT datetime of the observation.
+        :param values: dict quantity -> float, in the units given by units.
+        :param units: dict quantity -> astropy unit of values.
+        :param header: sequence of (keyword, value, comment) FITS cards.
+        :param created: time.time() of the refresh. Defaults to now.
+        :param expires: time.time() after which the snapshot must not be served. Defaults to never.
+        '''
+        object.__setattr__(self, 'obs_time', obs_time)
+        object.__setattr__(self, 'values', values)
+        object.__setattr__(self, 'units', units)
+        object.__setattr__(self, 'header', tuple(header))
+        object.__setattr__(self, 'created', time.time() if created is None else created)
+        object.__setattr__(self, 'expires', expires)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Snapshot is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError("Snapshot is read-only")
+
+    def expired(self):
+        return self.expires is not None and time.time() >= self.expires
+
+    def value(self, quantity, unit_out):
+        '''
+        :return: quantity converted to unit_out.
+        '''
+        return conversion.convert(self.values[quantity], self.units[quantity], unit_out)
+
+    def metadata(self):
+        '''
+        :return: list of FITS header cards.
+        '''
+        return list(self.header)
@@ -0,0 +1,456 @@
+import datetime
+import hashlib
+import threading
+import time
+
+from chimera_ctioenviroment import ctiodb, store
+from chimera_ctioenviroment.archive import Archive
+from chimera_ctioenviroment.exposure import exposure_window, align
+from chimera_ctioenviroment.feed import FeedReader, FeedWriter
+from chimera_ctioenviroment.history import History, to_timestamp
+from chimera_ctioenviroment.metrics import Metrics
+from chimera_ctioenviroment.poller import get_poller
+from chimera_ctioenviroment.polling import AdaptiveSchedule
+from chimera_ctioenviroment.replay import get_recorder
+from chimera_ctioenviroment.store import ReadingStore
+from chimera_ctioenviroment.thresholds import publish
+
+
+class SnapshotSource(object):
+    """
+    Mixin of the instruments serving the Snapshots of one data source. It keeps the readings on the history, the
+    on-disk cache, the long term archive and the shared feed, and serves them to history(), archived(),
+    statistics() and getMetadata().
+
+    Instruments list it before their chimera base class, set _units and _keywords, build their ChangeDetector (and
+    RollingStats, if any) before calling _open on __start__ and hand every new Snapshot of their source to _swap.
+    Polled sources schedule their polls as _job, cancelled on __stop__.
+    """
+
+    # units of the Snapshot values, the same used on the FITS headers.
+    _units = dict()
+    # cards aligned to the exposure by getMetadata and the ones held from the previous sample, see exposure.align.
+    _keywords = dict()
+    _steps = ()
+    # card with the UT time of the readings, moved to the middle of the exposure by getMetadata.
+    _date_keyword = None
+    # options naming the source of the readings, see _cache_path.
+    _source_options = ()
+
+    def __init__(self):
+        self._snapshot = None
+        # time.time() the source last confirmed the snapshot.
+        self._last_check = 0
+        self._history = None
+        self._stats = None
+        self._changes = None
+        self._schedule = None
+        self._publisher = None
+        self._reader = None
+        self._job = None
+        self._recorder = None
+        self._archive = None
+        self._store = None
+        self._metrics = Metrics()
+        self._metrics.gauge('staleness_seconds', lambda: time.time() - self._last_check if self._snapshot else None)
+        self._metrics.gauge('data_age_seconds', lambda: time.time() - to_timestamp(self._snapshot.obs_time) / 1e6)
+        self._metrics.gauge('publish_period_seconds', lambda: self._schedule.period)
+
+    def __stop__(self):
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
+        self._flush_archive()
+
+    def _open(self):
+        '''
+        Opens the history, the shared feed, the recorder, the archive and the on-disk cache of the configuration, then
+        restores the readings of a previous run and loads the ones kept by the source.
+        :return: False if the readings are read from the shared feed of another process, which fetches them.
+        '''
+        if self['shared_feed'] == 'read':
+            # another process fetches the data, see scripts/chimera-ctioenv-feed.
+            self._reader = FeedReader(self['shared_feed_path'], self._units)
+            self._history = self._reader.history
+            return False
+
+        if self['record_path']:
+            self._recorder = get_recorder(self['record_path'])
+        if self['archive_path']:
+            self._archive = Archive(self['archive_path'])
+        if self['shared_feed'] == 'publish':
+            self._publisher = FeedWriter(self['shared_feed_path'], self._units.keys(), self['history_size'])
+            self._history = self._publisher.history
+        else:
+            self._history = History(self['history_size'])
+        self._restore()
+        self._backfill()
+        if self._stats is not None:
+            self._stats.update(self._history)
+        if self._publisher is not None and self._snapshot is not None:
+            self._publisher.publish(self._snapshot, self._last_check)
+        return True
+
+    def _adaptive_schedule(self, interval, minimum, maximum):
+        '''
+        :param interval: option of the fixed interval, used when adaptive_schedule is off.
+        :param minimum: option of the minimum learned interval.
+        :param maximum: option of the maximum learned interval.
+        :return: polling.AdaptiveSchedule.
+        '''
+        if self['adaptive_schedule']:
+            return AdaptiveSchedule(self[minimum], self[maximum], self['max_backoff'])
+        return AdaptiveSchedule(self[interval], self[interval], self['max_backoff'])
+
+    def _cache_path(self):
+        '''
+        :return: cache_path with {source} replaced by a digest of the options naming the source, so the instances
+                 reading different sources, e.g. databases or LCOGT sites, do not share a cache.
+        '''
+        source = '|'.join([str(self[option]) for option in self._source_options])
+        return self['cache_path'].replace('{source}', hashlib.sha1(source).hexdigest()[:8])
+
+    def _restore(self):
+        '''
+        Loads the readings persisted by a previous run.
+        :return: True if the latest of them is fresh enough to be served.
+        '''
+        self._store = None
+        if not self['cache_path']:
+            return False
+        path = self._cache_path()
+        try:
+            self._store = ReadingStore(path)
+            latest = store.restore(self._store, self._history, self['cache_max_age'])
+        except Exception, e:
+            self.log.error('Error loading the reading cache %s: %s' % (path, e))
+            return False
+        if latest is None:
+            return False
+        obs_time, values, expires = latest
+        self._last_check = expires - self['cache_max_age']
+        self._snapshot = self._build_snapshot(obs_time, values, self._last_check, expires)
+        self._changes.restore(values)
+        return True
+
+    def _backfill(self):
+        '''
+        Loads on the history the readings of the source missing on it, for sources keeping their own history.
+        :return: Number of readings loaded.
+        '''
+        return 0
+
+    def _record(self, snapshot):
+        '''
+        Appends the readings of snapshot to the history, the rolling statistics and the on-disk cache.
+        '''
+        self._history.append(snapshot.obs_time, snapshot.values)
+        if self._stats is not None:
+            self._stats.update(self._history)
+        if self._store is not None:
+            try:
+                self._store.append(snapshot.obs_time, snapshot.values, snapshot.created)
+                if self._store.appended % store.TRIM_INTERVAL == 0:
+                    store.trim(self._store, self._history)
+            except Exception, e:
+                self.log.warning('Error writing to the reading cache %s: %s' % (self._store.path, e))
+        self._flush_archive(self['archive_interval'])
+
+    def _flush_archive(self, interval=0.):
+        '''
+        Appends the readings not archived yet to the long term archive, at most once every interval seconds.
+        '''
+        if self._archive is None or not self._archive.writable:
+            return
+        try:
+            self._archive.update(self._history, interval)
+        except Exception, e:
+            self.log.warning('Error writing to the archive %s: %s' % (self['archive_path'], e))
+
+    def _swap(self, snapshot):
+        '''
+        Serves snapshot from now on: records its readings, fires the reading events and publishes it on the shared
+        feed.
+        '''
+        self._snapshot = snapshot
+        self._record(snapshot)
+        publish(self, self._changes, snapshot.values, self._metrics)
+        self._last_check = time.time()
+        if self._publisher is not None:
+            self._publisher.publish(snapshot, self._last_check)
+
+    def _touch(self):
+        '''
+        Registers that the source still serves the current snapshot.
+        '''
+        self._last_check = time.time()
+        if self._publisher is not None:
+            self._publisher.touch(self._last_check)
+
+    def _check(self):
+        '''
+        Refreshes the snapshot when it is due, for sources refreshed on demand. Polled sources are always current.
+        :return: False if the refresh failed.
+        '''
+        self._metrics.inc('cache_hits')
+        return True
+
+    def _fresh(self, snapshot, checked):
+        '''
+        :param checked: time.time() the source last confirmed snapshot.
+        :return: True if snapshot may be served.
+        '''
+        return snapshot is not None and not snapshot.expired() and time.time() < checked + self['max_staleness']
+
+    def _current(self):
+        '''
+        Returns the current Snapshot or None if there is no valid data.
+        '''
+        if self._reader is not None:
+            self._snapshot, self._last_check = self._reader.snapshot()
+        elif not self._check():
+            return None
+        snapshot = self._snapshot
+        if self._fresh(snapshot, self._last_check):
+            return snapshot
+        return None
+
+    def history(self, quantity, since=None, until=None):
+        '''
+        Returns the buffered readings of quantity, in the same units as the FITS headers.
+        :param quantity: one of the readings of the instrument, e.g. seeing or temperature.
+        :param since: lower bound. UT datetime or seconds since the epoch.
+        :param until: upper bound. UT datetime or seconds since the epoch.
+        :return: (timestamps in microseconds since the epoch, values) numpy arrays, oldest first.
+        '''
+        return self._history.query(quantity, since, until)
+
+    def archived(self, quantity, since=None, until=None, low=None, high=None):
+        '''
+        Returns the readings of quantity kept on the long term archive, in the same units as the FITS headers.
+        :param quantity: one of the readings of the instrument, e.g. seeing or temperature.
+        :param since: lower bound. UT datetime or seconds since the epoch.
+        :param until: upper bound. UT datetime or seconds since the epoch.
+        :param low: only values not below low are returned.
+        :param high: only values not above high are returned.
+        :return: (timestamps in microseconds since the epoch, values) numpy arrays, oldest first.
+        '''
+        if self._archive is None:
+            if not self['archive_path']:
+                raise ValueError('archive_path is not set.')
+            # the archive is written by another process.
+            self._archive = Archive(self['archive_path'], writable=False)
+        return self._archive.query(quantity, since, until, low, high)
+
+    def _rolling(self, quantity, window):
+        # the statistics of a source which stopped answering are not served, like its snapshot.
+        if self._stats is None or self._current() is None:
+            return None
+        if self._reader is not None:
+            # the history is written by another process.
+            self._stats.update(self._history)
+        return self._stats.get(quantity, window)
+
+    def statistics(self, quantity, window=None):
+        '''
+        Returns the rolling statistics of quantity, in the same units as the FITS headers.
+        :param quantity: one of the readings of the instrument, e.g. seeing or temperature.
+        :param window: one of stats_windows, in seconds. Defaults to the shortest one.
+        :return: dict with count, mean, std, min, max, median, p10 and p90 of the readings and their since and until
+                 timestamps, in microseconds since the epoch. None if there are no readings, the instrument keeps
+                 no rolling statistics or its readings are stale, see max_staleness.
+        '''
+        return self._rolling(quantity, window)
+
+    def metrics(self):
+        '''
+        Returns latency histograms, cache hit/miss and error counters and staleness gauges of this instrument.
+        '''
+        return self._metrics.as_dict()
+
+    def metrics_text(self):
+        '''
+        Returns metrics() in the Prometheus text format.
+        '''
+        return self._metrics.prometheus('ctioenv_', instrument=self.__class__.__name__)
+
+    def getMetadata(self, request):
+
+        snapshot = self._current()
+        if snapshot is None:
+            return []
+
+        window = exposure_window(request) if self['exposure_aligned'] else None
+        if window is None:
+            return snapshot.metadata()
+        return align(snapshot.header, self._history, self._keywords, window, self['long_exposure'], self._steps,
+                     self._date_keyword)
+
+
+class TableSource(SnapshotSource):
+    """
+    SnapshotSource of a table of the CTIO database, queried on demand through the snapshot shared by the
+    instruments on the same URI. Accessors are served stale-while-revalidate.
+
+    Instruments implement _get_mysql, which returns the latest row, _make_snapshot(*row) and _fetch_backfill.
+    """
+
+    def __init__(self):
+        SnapshotSource.__init__(self)
+        self._next_check = 0
+        self._watermark = None
+        self._db = None
+        self._outage = False
+        self._refreshing = False
+        self._refresh_lock = threading.Lock()
+
+    def __start__(self):
+        self._schedule = self._adaptive_schedule('check_interval', 'min_check_interval', 'max_check_interval')
+        if self['shared_feed'] != 'read' and not self['replay']:
+            self._db = ctiodb.get_cache(self['uri'])
+        if not self._open() or self['replay']:
+            return
+        if self._publisher is not None:
+            self._job = get_poller().schedule(self._poll, name=self.__class__.__name__)
+        elif self['stale_while_revalidate']:
+            self._revalidate()
+
+    def _restore(self):
+        restored = SnapshotSource._restore(self)
+        if restored:
+            self._next_check = self._last_check + self._schedule.delay()
+        return restored
+
+    def _backfill(self):
+        '''
+        Loads on the history every reading newer than the latest one buffered, up to backfill seconds old.
+        :return: Number of rows loaded.
+        '''
+        if self['backfill'] <= 0 or self._db is None:
+            return 0
+        since = time.time() - self['backfill']
+        last = self._history.last_timestamp()
+        if last is not None:
+            since = max(since, last / 1e6)
+
+        try:
+            t, values = self._fetch_backfill(datetime.datetime.utcfromtimestamp(since))
+        except Exception, e:
+            self.log.error('Error backfilling from URI %s: %s' % (self["uri"], e))
+            return 0
+
+        self._history.extend(t, values)
+        self.log.debug('Backfilled %d rows.' % len(t))
+        return len(t)
+
+    def _refresh(self, raw=None):
+        '''
+        Queries the database and swaps the new snapshot in, unless the latest row is still the one already served.
+        :param raw: row to use instead of querying the database, see replay.
+        :return: True if the snapshot was refreshed or confirmed.
+        '''
+        if raw is None:
+            raw = self._get_mysql()
+            if self._recorder is not None and raw and raw[0] != self._watermark:
+                self._recorder.record(self.__class__.__name__, raw)
+        if raw and raw[0] == self._watermark:
+            self._metrics.inc('skipped_refreshes')
+            self._outage = False
+            self._touch()
+            self._next_check = self._last_check + self._schedule.observe(to_timestamp(raw[0]) / 1e6)
+            return True
+        try:
+            snapshot = self._make_snapshot(*raw)
+        except TypeError:
+            self._metrics.inc('refresh_failures')
+            self._outage = True
+            self._next_check = time.time() + self._schedule.failed()
+            return False
+        self._watermark = raw[0]
+        if self._outage:
+            self._backfill()
+        self._outage = False
+        self._swap(snapshot)
+        self._next_check = self._last_check + self._schedule.observe(to_timestamp(raw[0]) / 1e6)
+        return True
+
+    def _background_refresh(self):
+        try:
+            with self._metrics.timer('refresh_seconds'):
+                self._refresh()
+        except Exception, e:
+            self._metrics.error(e)
+            self.log.exception('Error refreshing in background: %s' % e)
+            # otherwise every accessor call starts another refresh against the failing database.
+            self._next_check = time.time() + self._schedule.failed()
+        finally:
+            self._refreshing = False
+
+    def _revalidate(self):
+        '''
+        Starts a background refresh, unless there is one already running.
+        '''
+        with self._refresh_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        thread = threading.Thread(target=self._background_refresh, name='%s refresh' % self.__class__.__name__)
+        thread.daemon = True
+        thread.start()
+
+    def replay(self, raw):
+        '''
+        Processes a database row recorded with the record_path option, see replay.Replayer.
+        '''
+        return self._refresh(raw)
+
+    def _poll(self):
+        '''
+        Refreshes from the shared poller while publishing the shared feed.
+        :return: time until the next refresh, in seconds.
+        '''
+        with self._metrics.timer('refresh_seconds'):
+            self._refresh()
+        return max(0., self._next_check - time.time())
+
+    def _check(self):
+        if self['replay'] or time.time() < self._next_check:
+            self._metrics.inc('cache_hits')
+            return True
+        self._metrics.inc('cache_misses')
+        if self['stale_while_revalidate']:
+            self._revalidate()
+            return True
+        # single-flight: the callers which waited for the lock take the snapshot it refreshed.
+        with self._refresh_lock:
+            if time.time() < self._next_check:
+                return True
+            return self._refresh()
+
+    def obs_time(self):
+        '''
+        Returns a string with UT date/time of the meteorological observation
+        '''
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        return snapshot.obs_time
+
+    def metrics(self):
+        '''
+        Returns latency histograms, cache hit/miss and error counters and staleness gauges of this instrument and
+        of the database snapshot it shares with the other instruments on the same URI.
+        '''
+        metrics = self._db.metrics.as_dict() if self._db is not None else dict()
+        metrics.update(self._metrics.as_dict())
+        return metrics
+
+    def metrics_text(self):
+        '''
+        Returns metrics() in the Prometheus text format.
+        '''
+        instrument = self.__class__.__name__
+        text = self._metrics.prometheus('ctioenv_', instrument=instrument)
+        if self._db is not None:
+            text = self._db.metrics.prometheus('ctioenv_db_', instrument=instrument) + text
+        return text
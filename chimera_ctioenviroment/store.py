@@ -0,0 +1,127 @@
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from chimera_ctioenviroment.history import to_timestamp
+
+# appends between two trims of a store to the history window, see trim.
+TRIM_INTERVAL = 256
+
+
+class ReadingStore(object):
+    """
+    SQLite file with the recent readings of one instrument, used to warm up after restarts. See trim.
+    """
+
+    def __init__(self, path):
+        path = os.path.expanduser(path)
+        if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.path = path
+        # readings appended since the store was opened.
+        self.appended = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("pragma journal_mode=wal")
+        self._db.execute("create table if not exists readings"
+                         " (t integer not null, quantity text not null, value real, created real not null)")
+        self._db.execute("create index if not exists readings_qt on readings (quantity, t)")
+        self._db.execute("create index if not exists readings_t on readings (t)")
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def append(self, obs_time, values, created=None):
+        '''
+        :param obs_time: time of the readings, see history.to_timestamp.
+        :param values: dict quantity -> value.
+        :param created: time.time() of the refresh. Defaults to now.
+        '''
+        t = to_timestamp(obs_time)
+        created = time.time() if created is None else created
+        with self._lock:
+            self._db.executemany("insert into readings values (?, ?, ?, ?)",
+                                 [(t, quantity, value, created) for quantity, value in values.iteritems()])
+            self._db.commit()
+            self.appended += 1
+
+    def latest(self):
+        '''
+        :return: (obs_time as UT datetime, dict quantity -> value, created) of the latest readings or None.
+        '''
+        with self._lock:
+            row = self._db.execute("select t, max(created) from readings where t = (select max(t) from readings)"
+                                   ).fetchone()
+            if row is None or row[0] is None:
+                return None
+            t, created = row
+            values = dict(self._db.execute("select quantity, value from readings where t = ?", (t,)).fetchall())
+        return datetime.datetime.utcfromtimestamp(t / 1e6), values, created
+
+    def load(self, size):
+        '''
+        :param size: maximum number of readings per quantity.
+        :return: dict quantity -> (int64 timestamps, float32 values), oldest first.
+        '''
+        history = dict()
+        with self._lock:
+            quantities = [row[0] for row in self._db.execute("select distinct quantity from readings")]
+            for quantity in quantities:
+                rows = self._db.execute("select t, value from readings where quantity = ? and value is not null"
+                                        " order by t desc limit ?", (quantity, size)).fetchall()
+                if rows:
+                    t, v = zip(*rows[::-1])
+                    history[quantity] = np.array(t, dtype=np.int64), np.array(v, dtype=np.float32)
+        return history
+
+    def prune(self, before):
+        '''
+        Removes the readings older than before, in microseconds since the epoch.
+        '''
+        with self._lock:
+            self._db.execute("delete from readings where t < ?", (before,))
+            self._db.commit()
+
+
+def trim(store, history):
+    '''
+    Drops from the store the readings older than the ones kept on history, so the file does not outgrow it.
+    :param store: ReadingStore.
+    :param history: history.History fed with the same readings.
+    '''
+    oldest = []
+    for quantity in history.quantities():
+        t, v = history.query(quantity)
+        if len(t):
+            oldest.append(t[0])
+    if oldest:
+        store.prune(min(oldest))
+
+
+def restore(store, history, max_age):
+    '''
+    Loads the stored readings on history and drops from the store the ones that do not fit on it.
+    :param store: ReadingStore.
+    :param history: history.History to be filled.
+    :param max_age: maximum age of the latest readings to be served, in seconds.
+    :return: (obs_time, values, expires) of the latest readings or None if there are none fresh enough.
+    '''
+    loaded = store.load(history.capacity)
+    for quantity, (t, v) in loaded.iteritems():
+        history.buffer(quantity).extend(t, v)
+    if loaded:
+        store.prune(min([t[0] for t, v in loaded.values()]))
+
+    latest = store.latest()
+    if latest is None:
+        return None
+    obs_time, values, created = latest
+    if created + max_age <= time.time():
+        return None
+    return obs_time, values, created + max_age
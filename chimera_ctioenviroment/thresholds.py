@@ -0,0 +1,108 @@
+from chimera.core.event import event
+from chimera.core.interface import Interface
+
+
+class ReadingEvents(Interface):
+    """
+    Events fired when a refreshed reading changes enough to matter, so clients can subscribe instead of polling.
+    Values are in the units of the FITS headers.
+    """
+
+    @event
+    def readingChanged(self, quantity, value, previous):
+        """
+        Fired when quantity moved at least its deadband since the last time it was fired.
+
+        :param quantity: name of the reading, as given to history(), e.g. seeing or wind_speed.
+        :param value: new reading.
+        :param previous: reading of the previous event or None on the first one.
+        """
+
+    @event
+    def thresholdCrossed(self, quantity, value, limit, above):
+        """
+        Fired when quantity crossed its limit.
+
+        :param quantity: name of the reading, as given to history(), e.g. seeing or wind_speed.
+        :param value: new reading.
+        :param limit: configured limit.
+        :param above: True if the reading went above the limit, False if it went back below it.
+        """
+
+
+class ChangeDetector(object):
+    """
+    Finds the readings which moved more than a deadband and the ones which crossed a limit. Going back below a limit
+    needs the reading to drop the deadband under it, so a noisy reading does not flip-flop around the limit. The
+    first reading of a quantity already above its limit is reported as a crossing.
+    """
+
+    def __init__(self, deadbands=None, limits=None):
+        '''
+        :param deadbands: dict quantity -> minimum change worth an event. Zero or None disables it.
+        :param limits: dict quantity -> limit. Zero or None disables it.
+        '''
+        self.deadbands = dict([(q, d) for q, d in (deadbands or {}).items() if d])
+        self.limits = dict([(q, l) for q, l in (limits or {}).items() if l])
+        self._published = dict()
+        self._above = dict()
+
+    def update(self, values):
+        '''
+        :param values: dict quantity -> reading of one refresh.
+        :return: (changes, crossings). changes is a list of (quantity, value, previous) and crossings a list of
+                 (quantity, value, limit, above), as the arguments of the ReadingEvents.
+        '''
+        changes = []
+        for quantity, deadband in self.deadbands.iteritems():
+            value = values.get(quantity)
+            if value is None or value != value:
+                continue
+            previous = self._published.get(quantity)
+            if previous is None or abs(value - previous) >= deadband:
+                self._published[quantity] = value
+                changes.append((quantity, value, previous))
+
+        crossings = []
+        for quantity, limit in self.limits.iteritems():
+            value = values.get(quantity)
+            if value is None or value != value:
+                continue
+            if self._above.get(quantity):
+                above = value > limit - self.deadbands.get(quantity, 0.)
+            else:
+                above = value > limit
+            if self._above.get(quantity, False) != above:
+                crossings.append((quantity, value, limit, above))
+            self._above[quantity] = above
+
+        return changes, crossings
+
+    def restore(self, values):
+        '''
+        Takes the readings of a previous run as the reference of the deadbands. Limits are left unknown, so the first
+        live reading above a limit is still reported.
+        :param values: dict quantity -> reading.
+        '''
+        for quantity in self.deadbands:
+            value = values.get(quantity)
+            if value is not None and value == value:
+                self._published[quantity] = value
+
+
+def publish(instrument, detector, values, metrics=None):
+    '''
+    Fires the ReadingEvents of instrument for the readings in values.
+    :param detector: ChangeDetector of instrument.
+    :param metrics: Metrics where the fired events are counted.
+    '''
+    changes, crossings = detector.update(values)
+    for change in changes:
+        instrument.readingChanged(*change)
+    for crossing in crossings:
+        instrument.thresholdCrossed(*crossing)
+    if metrics is not None:
+        if changes:
+            metrics.inc('events', len(changes), event='readingChanged')
+        if crossings:
+            metrics.inc('events', len(crossings), event='thresholdCrossed')
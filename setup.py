@@ -4,8 +4,9 @@ setup(
     name='chimera_ctioenviroment',
     version='0.0.1',
     packages=['chimera_ctioenviroment', 'chimera_ctioenviroment.instruments'],
-    scripts=[],
-    install_requires=['mysql', 'requests>=2.8.1', 'xmltodict'],
+    scripts=['scripts/chimera-ctioenv-feed'],
+    install_requires=['mysql', 'requests>=2.8.1', 'numpy'],
+    extras_require={'benchmark': ['xmltodict']},
     url='http://github.com/astroufsc/chimera-ctioenviroment',
     license='GPL v2',
     author='William Schoenell',
@@ -0,0 +1,76 @@
+import datetime
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from chimera_ctioenviroment.archive import Archive
+from chimera_ctioenviroment.history import to_timestamp
+
+HALF_HOUR = 1800 * 1000000
+
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.archive = Archive(self.root)
+        # samples every half an hour from 2017-03-01 00:00 to 2017-03-02 23:30 UT.
+        self.t = to_timestamp(datetime.datetime(2017, 3, 1)) + HALF_HOUR * np.arange(96, dtype=np.int64)
+        self.v = np.arange(96, dtype=np.float32)
+
+    def test_chunks_split_at_night_offset(self):
+        self.assertEqual(self.archive.append('temperature', self.t, self.v), 96)
+        chunks = self.archive.chunks('temperature')
+        # nights start at 12 UT.
+        self.assertEqual(chunks['night'].tolist(), [20170228, 20170301, 20170302])
+        self.assertEqual(chunks['count'].tolist(), [24, 48, 24])
+        self.assertEqual(chunks['offset'].tolist(), [0, 24, 72])
+        self.assertEqual(chunks['min'].tolist(), [0., 24., 72.])
+        self.assertEqual(chunks['max'].tolist(), [23., 71., 95.])
+
+    def test_appends_extend_the_last_chunk(self):
+        self.archive.append('temperature', self.t[:40], self.v[:40])
+        self.archive.append('temperature', self.t[40:60], self.v[40:60])
+        self.assertEqual(self.archive.chunks('temperature')['count'].tolist(), [24, 36])
+        self.archive.append('temperature', self.t[60:], self.v[60:])
+        self.assertEqual(self.archive.chunks('temperature')['count'].tolist(), [24, 48, 24])
+        t, v = self.archive.query('temperature')
+        self.assertEqual(t.tolist(), self.t.tolist())
+        self.assertEqual(v.tolist(), self.v.tolist())
+
+    def test_gap_too_long_for_a_delta_starts_a_chunk(self):
+        # both samples are on the same night, 50 minutes apart: more than 2**31 microseconds.
+        t = np.array([self.t[26], self.t[26] + 50 * 60 * 1000000], dtype=np.int64)
+        self.archive.append('temperature', t, [1., 2.])
+        chunks = self.archive.chunks('temperature')
+        self.assertEqual(chunks['night'].tolist(), [20170301, 20170301])
+        self.assertEqual(self.archive.query('temperature')[0].tolist(), t.tolist())
+
+    def test_old_and_nan_samples_are_skipped(self):
+        self.archive.append('temperature', self.t[:10], self.v[:10])
+        v = self.v[5:20].copy()
+        v[10] = np.nan
+        self.assertEqual(self.archive.append('temperature', self.t[5:20], v), 9)
+        self.assertEqual(len(self.archive.query('temperature')[0]), 19)
+
+    def test_query_reads_only_matching_samples(self):
+        self.archive.append('temperature', self.t, self.v)
+        t, v = self.archive.query('temperature', since=self.t[10] / 1e6, until=self.t[14] / 1e6)
+        self.assertEqual(v.tolist(), [10., 11., 12., 13., 14.])
+        t, v = self.archive.query('temperature', low=20, high=22)
+        self.assertEqual(t.tolist(), self.t[20:23].tolist())
+
+    def test_reader_sees_the_writer_appends(self):
+        reader = Archive(self.root, writable=False)
+        self.archive.append('temperature', self.t[:20], self.v[:20])
+        self.assertEqual(len(reader.query('temperature')[0]), 20)
+        self.archive.append('temperature', self.t[20:], self.v[20:])
+        self.assertEqual(reader.query('temperature')[1].tolist(), self.v.tolist())
+        self.assertEqual(reader.last_timestamp('temperature'), self.t[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
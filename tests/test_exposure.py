@@ -0,0 +1,59 @@
+import datetime
+import unittest
+
+from chimera_ctioenviroment.exposure import exposure_window, align
+from chimera_ctioenviroment.history import History, to_timestamp
+
+START = datetime.datetime(2017, 3, 1, 1, 0, 0)
+
+
+class Request(dict):
+    # the cards collected by a chimera ImageRequest.
+    headers = []
+
+
+class ExposureWindowTest(unittest.TestCase):
+
+    def test_window_starts_at_frame_start(self):
+        window = exposure_window(dict(exptime=30, frameStart=START), now=to_timestamp(START) / 1e6 + 60)
+        self.assertEqual(window, (to_timestamp(START), to_timestamp(START) + 30000000))
+
+    def test_window_starts_at_collected_date_obs(self):
+        request = Request(exptime=30)
+        request.headers = [('DATE-OBS', '2017-03-01T01:00:00.500000', 'Date exposure started')]
+        window = exposure_window(request, now=to_timestamp(START) / 1e6 + 60)
+        self.assertEqual(window, (to_timestamp(START) + 500000, to_timestamp(START) + 30500000))
+
+    def test_no_window_before_the_exposure(self):
+        self.assertIsNone(exposure_window(dict(exptime=30, frameStart=START), now=to_timestamp(START) / 1e6 - 1))
+
+    def test_no_window_without_start(self):
+        self.assertIsNone(exposure_window(dict(exptime=30)))
+        self.assertIsNone(exposure_window(None))
+
+
+class AlignTest(unittest.TestCase):
+
+    def setUp(self):
+        self.history = History(16)
+        for i, temperature in enumerate([10., 12., 14.]):
+            self.history.append(START + datetime.timedelta(seconds=60 * i), dict(temperature=temperature))
+        self.cards = [('ENVTEM', 14., '[degC] Weather station temperature'),
+                      ('ENVDAT', '2017-03-01T01:02:00.000000', 'UT time of the meteo observation')]
+
+    def test_date_card_follows_the_aligned_values(self):
+        start = to_timestamp(START)
+        cards = align(self.cards, self.history, dict(ENVTEM='temperature'), (start, start + 60000000), 600,
+                      date='ENVDAT')
+        self.assertEqual(cards[0][:2], ('ENVTEM', 11.))
+        self.assertEqual(cards[1][:2], ('ENVDAT', '2017-03-01T01:00:30.000000'))
+
+    def test_date_card_kept_past_the_latest_reading(self):
+        start = to_timestamp(START) + 120000000
+        cards = align(self.cards, self.history, dict(ENVTEM='temperature'), (start, start + 60000000), 600,
+                      date='ENVDAT')
+        self.assertEqual(cards, self.cards)
+
+
+if __name__ == '__main__':
+    unittest.main()
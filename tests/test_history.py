@@ -0,0 +1,61 @@
+import unittest
+
+import numpy as np
+
+from chimera_ctioenviroment.history import RingBuffer
+
+
+def samples(first, n):
+    t = np.arange(first, first + n, dtype=np.int64) * 1000000
+    return t, t.astype(np.float32) / 1e6
+
+
+class RingBufferTest(unittest.TestCase):
+
+    def assertHolds(self, buf, first, last):
+        t, v = buf.query()
+        self.assertEqual(t.tolist(), [i * 1000000 for i in range(first, last + 1)])
+        self.assertEqual(v.tolist(), [float(i) for i in range(first, last + 1)])
+        self.assertEqual(buf.last(), (last * 1000000, float(last)))
+
+    def test_extend_wraps_around(self):
+        buf = RingBuffer(8)
+        self.assertEqual(buf.extend(*samples(0, 5)), 5)
+        # 3 samples fill the end of the arrays, the other 3 are written at their start.
+        self.assertEqual(buf.extend(*samples(5, 6)), 6)
+        self.assertEqual(len(buf), 8)
+        self.assertHolds(buf, 3, 10)
+
+    def test_extend_longer_than_capacity_keeps_the_latest(self):
+        buf = RingBuffer(8)
+        buf.extend(*samples(0, 3))
+        self.assertEqual(buf.extend(*samples(3, 20)), 8)
+        self.assertHolds(buf, 15, 22)
+
+    def test_extend_skips_samples_not_newer_than_the_last(self):
+        buf = RingBuffer(8)
+        buf.extend(*samples(0, 6))
+        self.assertEqual(buf.extend(*samples(4, 4)), 2)
+        self.assertEqual(buf.extend(*samples(0, 8)), 0)
+        self.assertHolds(buf, 0, 7)
+
+    def test_extend_matches_append(self):
+        appended, extended = RingBuffer(8), RingBuffer(8)
+        first = 0
+        for n in (3, 7, 1, 8, 5, 13, 2):
+            t, v = samples(first, n)
+            for sample_t, value in zip(t, v):
+                appended.append(sample_t, value)
+            extended.extend(t, v)
+            first += n
+            self.assertEqual([a.tolist() for a in appended.query()], [a.tolist() for a in extended.query()])
+
+    def test_query_bounds_are_inclusive(self):
+        buf = RingBuffer(8)
+        buf.extend(*samples(0, 12))
+        t, v = buf.query(since=6000000, until=9000000)
+        self.assertEqual(v.tolist(), [6., 7., 8., 9.])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import json
+import time
+import unittest
+
+from chimera_ctioenviroment.instruments.lcogtweather import LCOGTScrapper, last_element
+
+
+def datum(stamp, value):
+    return {u'TimeStamp': stamp, u'TimeStampMeasured': stamp, u'Value': value, u'ValueString': unicode(value)}
+
+
+class Response(object):
+
+    def __init__(self, body):
+        self.content = json.dumps(body)
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class Session(object):
+    """
+    Answers every query with body, after delays[0] seconds for the first one, delays[1] for the second one...
+    Queries of the URLs containing a key of slow take its value seconds more.
+    """
+
+    def __init__(self, body, delays=(), slow=None):
+        self.body = body
+        self.delays = list(delays)
+        self.slow = slow or dict()
+
+    def get(self, url, **kwargs):
+        if self.delays:
+            time.sleep(self.delays.pop(0))
+        for name, delay in self.slow.items():
+            if name in url:
+                time.sleep(delay)
+        return Response(self.body)
+
+
+class LastElementTest(unittest.TestCase):
+
+    def chunks(self, body, size):
+        body = json.dumps(body).encode('utf-8')
+        return [body[i:i + size] for i in range(0, len(body), size)]
+
+    def test_last_element_of_any_chunking(self):
+        body = [datum(u'2017/03/01 01:00:%02d' % i, i * 1.5) for i in range(20)] + [{u'Site': u'\xf1u\xf1oa'}]
+        for size in (1, 2, 7, 64, 100000):
+            self.assertEqual(last_element(self.chunks(body, size)), body[-1])
+
+    def test_empty_array(self):
+        self.assertIsNone(last_element(self.chunks([], 1)))
+        self.assertIsNone(last_element([b' [ ', b' ] ']))
+
+    def test_invalid_bodies(self):
+        self.assertRaises(ValueError, last_element, [b'{"Value": 1}'])
+        self.assertRaises(ValueError, last_element, self.chunks([1, 2, 3], 3)[:-1])
+        self.assertRaises(ValueError, last_element, [b'[1, 2'])
+
+
+class LCOGTScrapperTest(unittest.TestCase):
+
+    def scrapper(self, session, **kwargs):
+        scrapper = LCOGTScrapper(incremental=False, session=session, keys=['temperature'], **kwargs)
+        self.addCleanup(scrapper.close)
+        return scrapper
+
+    def test_body_late_on_the_deadline_is_used_on_the_next_scrape(self):
+        session = Session([datum(u'2017/03/01 01:00:00', 12.)], delays=[0.2])
+        scrapper = self.scrapper(session, deadline=0.05)
+        self.assertIsNone(scrapper.scrape())
+        self.assertEqual(scrapper.failures, 1)
+        time.sleep(0.2)
+        site = scrapper.sites[0]
+        self.assertEqual(scrapper.scrape()[site]['temperature']['Value'], 12.)
+        self.assertEqual(scrapper.failures, 0)
+
+    def test_datum_missing_the_deadline_keeps_its_previous_value(self):
+        session = Session([datum(u'2017/03/01 01:00:00', 12.)])
+        scrapper = LCOGTScrapper(incremental=False, session=session, keys=['temperature', 'humidity'], deadline=0.05)
+        self.addCleanup(scrapper.close)
+        site = scrapper.sites[0]
+        self.assertEqual(scrapper.scrape()[site]['humidity']['Value'], 12.)
+        session.body = [datum(u'2017/03/01 01:01:00', 13.)]
+        session.slow = {'Humidity': 0.2}
+        scrape = scrapper.scrape()
+        self.assertEqual(scrapper.failed, [(site, 'humidity')])
+        self.assertEqual(scrape[site]['temperature']['Value'], 13.)
+        self.assertEqual(scrape[site]['humidity']['Value'], 12.)
+
+    def test_unchanged_body_is_not_a_change(self):
+        session = Session([datum(u'2017/03/01 01:00:00', 12.)])
+        scrapper = self.scrapper(session, concurrent=False)
+        self.assertIsNotNone(scrapper.scrape())
+        self.assertIsNone(scrapper.scrape())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+from chimera_ctioenviroment.polling import AdaptiveSchedule
+
+
+def run(schedule, samples, now, until, lag=1.):
+    '''
+    Polls a source publishing at the times in samples, which shows up lag seconds later, from now until until.
+    :return: time of the next poll.
+    '''
+    while now < until:
+        published = [t for t in samples if t + lag <= now]
+        if published:
+            delay = schedule.observe(published[-1], now)
+        else:
+            delay = schedule.delay(now)
+        now += delay
+    return now
+
+
+class AdaptiveScheduleTest(unittest.TestCase):
+
+    def test_short_first_interval_is_outvoted(self):
+        schedule = AdaptiveSchedule(10, 600)
+        samples = [0., 20.] + [20. + 60. * i for i in range(1, 10)]
+        for t in samples:
+            schedule.observe(t, t + 1.)
+        self.assertEqual(schedule.period, 60.)
+
+    def test_cadence_change_is_learned(self):
+        schedule = AdaptiveSchedule(10, 600)
+        samples = [60. * i for i in range(60)]
+        now = run(schedule, samples, 1., 3540.)
+        self.assertAlmostEqual(schedule.period, 60.)
+        samples += [3600. + 300. * i for i in range(12)]
+        run(schedule, samples, now, 6600.)
+        self.assertAlmostEqual(schedule.period, 300.)
+
+    def test_missed_samples_count_as_several_periods(self):
+        schedule = AdaptiveSchedule(10, 600)
+        for t in range(0, 600, 60):
+            schedule.observe(float(t), t + 1.)
+        # polls stopped by an outage: 180 s are 3 periods of 60 s.
+        for t in (780., 960., 1140., 1320., 1500.):
+            schedule.observe(t, t + 1.)
+        self.assertEqual(schedule.period, 60.)
+
+    def test_unconfirmed_period_does_not_split_intervals(self):
+        schedule = AdaptiveSchedule(10, 600)
+        for t in (0., 60., 180., 300., 420., 540.):
+            schedule.observe(t, t + 1.)
+        self.assertEqual(schedule.period, 120.)
+
+    def test_polls_without_new_sample_back_off(self):
+        schedule = AdaptiveSchedule(10, 600)
+        for t in range(0, 600, 60):
+            schedule.observe(float(t), t + 1.)
+        delays = [schedule.observe(540., 601. + i) for i in range(3)]
+        self.assertEqual(delays, [12., 24., 48.])
+
+    def test_paused_source_is_learned_again(self):
+        schedule = AdaptiveSchedule(10, 600)
+        for t in range(0, 600, 60):
+            schedule.observe(float(t), t + 1.)
+        for i in range(3):
+            schedule.observe(540., 601. + i)
+        # the interval spanning the pause is not a period.
+        schedule.observe(2000., 2001.)
+        self.assertIsNone(schedule.period)
+        self.assertEqual(schedule.delay(2001.), 10)
+        schedule.observe(2030., 2031.)
+        self.assertEqual(schedule.period, 30.)
+
+    def test_failures_back_off_up_to_max_backoff(self):
+        schedule = AdaptiveSchedule(10, 60, max_backoff=300)
+        delays = [schedule.failed() for i in range(10)]
+        self.assertTrue(5 <= delays[0] <= 10)
+        self.assertTrue(all(150 <= delay <= 300 for delay in delays[6:]))
+        schedule.observe(0., 1.)
+        self.assertTrue(5 <= schedule.failed() <= 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
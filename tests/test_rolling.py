@@ -0,0 +1,71 @@
+import random
+import unittest
+
+import numpy as np
+
+from chimera_ctioenviroment.rolling import IndexableSkiplist, RollingWindow
+
+
+class IndexableSkiplistTest(unittest.TestCase):
+
+    def test_ranks_follow_a_sorted_list(self):
+        skiplist = IndexableSkiplist(64)
+        expected = []
+        rng = random.Random(1)
+        for i in range(500):
+            if expected and rng.random() < 0.4:
+                value = rng.choice(expected)
+                expected.remove(value)
+                skiplist.remove(value)
+            else:
+                value = float(rng.randint(0, 50))
+                expected.append(value)
+                skiplist.insert(value)
+        expected.sort()
+        self.assertEqual([skiplist[i] for i in range(len(skiplist))], expected)
+        self.assertRaises(KeyError, skiplist.remove, 100.)
+
+
+class RollingWindowTest(unittest.TestCase):
+
+    def test_statistics_match_numpy(self):
+        window = RollingWindow(60)
+        rng = random.Random(2)
+        t = 0
+        samples = []
+        for i in range(300):
+            t += rng.randint(1, 10) * 1000000
+            value = 1000. + rng.gauss(0, 5)
+            window.append(t, value)
+            samples.append((t, value))
+            values = np.array([v for sample_t, v in samples if sample_t > t - 60000000])
+            stats = window.stats
+            self.assertEqual(stats['count'], len(values))
+            self.assertAlmostEqual(stats['mean'], values.mean(), places=6)
+            self.assertAlmostEqual(stats['std'], values.std(), places=4)
+            self.assertEqual(stats['min'], values.min())
+            self.assertEqual(stats['max'], values.max())
+            for p in (10, 50, 90):
+                self.assertAlmostEqual(stats['p%d' % p], np.percentile(values, p), places=6)
+            self.assertEqual(stats['median'], stats['p50'])
+
+    def test_expired_maximum_is_dropped(self):
+        window = RollingWindow(10)
+        window.append(0, 20.)
+        window.append(5000000, 5.)
+        self.assertEqual(window.stats['max'], 20.)
+        window.append(10000000, 6.)
+        self.assertEqual((window.stats['max'], window.stats['min'], window.stats['count']), (6., 5., 2))
+        self.assertEqual(window.stats['since'], 5000000)
+
+    def test_old_and_invalid_samples_are_ignored(self):
+        window = RollingWindow(10)
+        self.assertTrue(window.append(1000000, 1.))
+        self.assertFalse(window.append(1000000, 2.))
+        self.assertFalse(window.append(2000000, float('nan')))
+        self.assertFalse(window.append(3000000, float('inf')))
+        self.assertEqual((window.stats['count'], window.last), (1, 1000000))
+
+
+if __name__ == '__main__':
+    unittest.main()
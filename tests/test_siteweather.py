@@ -0,0 +1,51 @@
+import datetime
+import unittest
+
+from astropy import units
+from chimera.interfaces.weatherstation import WSValue, WeatherTemperature, WeatherTransparency
+
+from chimera_ctioenviroment.instruments.siteweather import SiteWeather
+
+
+class Source(object):
+    """
+    Proxy stand-in of a weather instrument implementing interfaces.
+    """
+
+    def __init__(self, interfaces, temperature=None, transparency=None):
+        self.interfaces = interfaces
+        self.values = dict(temperature=temperature, sky_transparency=transparency)
+        self.calls = []
+
+    def features(self, interface):
+        self.calls.append('features')
+        return interface in self.interfaces
+
+    def __getattr__(self, method):
+        def call(unit_out):
+            self.calls.append(method)
+            return WSValue(datetime.datetime.utcnow(), self.values[method], unit_out)
+        return call
+
+
+class SiteWeatherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sources = {'/CTIOWeather/0': Source([WeatherTemperature], temperature=12.),
+                        '/Rasicam/0': Source([WeatherTransparency], transparency=100.)}
+        self.site = SiteWeather()
+        self.site['sources'] = sorted(self.sources)
+        self.site._proxy = self.sources.get
+        self.site.__start__()
+        self.addCleanup(self.site.__stop__)
+
+    def test_only_implementing_sources_are_asked(self):
+        self.assertEqual(self.site.temperature().value, 12.)
+        self.assertEqual(self.site.sky_transparency(units.pct).value, 100.)
+        self.assertEqual(self.site.temperature().value, 12.)
+        self.assertEqual(self.sources['/CTIOWeather/0'].calls, ['features', 'temperature', 'features', 'temperature'])
+        self.assertEqual(self.sources['/Rasicam/0'].calls, ['features', 'features', 'sky_transparency'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from chimera_ctioenviroment.thresholds import ChangeDetector
+
+
+class ChangeDetectorTest(unittest.TestCase):
+
+    def test_first_reading_above_limit_is_a_crossing(self):
+        detector = ChangeDetector(deadbands=dict(wind_speed=1.), limits=dict(wind_speed=14.))
+        changes, crossings = detector.update(dict(wind_speed=20.))
+        self.assertEqual(crossings, [('wind_speed', 20., 14., True)])
+        self.assertEqual(detector.update(dict(wind_speed=21.))[1], [])
+
+    def test_first_reading_below_limit_is_not_a_crossing(self):
+        detector = ChangeDetector(limits=dict(humidity=85.))
+        self.assertEqual(detector.update(dict(humidity=40.))[1], [])
+        self.assertEqual(detector.update(dict(humidity=90.))[1], [('humidity', 90., 85., True)])
+
+    def test_restored_reading_does_not_hide_the_first_crossing(self):
+        detector = ChangeDetector(deadbands=dict(humidity=5.), limits=dict(humidity=85.))
+        detector.restore(dict(humidity=90.))
+        changes, crossings = detector.update(dict(humidity=91.))
+        self.assertEqual(changes, [])
+        self.assertEqual(crossings, [('humidity', 91., 85., True)])
+
+    def test_going_back_below_needs_the_deadband(self):
+        detector = ChangeDetector(deadbands=dict(humidity=5.), limits=dict(humidity=85.))
+        detector.update(dict(humidity=90.))
+        self.assertEqual(detector.update(dict(humidity=82.))[1], [])
+        self.assertEqual(detector.update(dict(humidity=79.))[1], [('humidity', 79., 85., False)])
+
+
+if __name__ == '__main__':
+    unittest.main()